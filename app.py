@@ -1,118 +1,654 @@
-from fastapi import FastAPI, Request, Form, UploadFile, File
-from fastapi.responses import HTMLResponse
+import time
+
+# Startup is timed from here, so it covers the app's own imports
+_started = time.perf_counter()
+
+from fastapi import FastAPI, Request, Form, HTTPException
+from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.background import BackgroundTask
+from python_multipart.exceptions import MultipartParseError
+from python_multipart.multipart import MultipartParser, parse_options_header
 from sse_starlette.sse import EventSourceResponse
 import json
 import asyncio
-import whisper
-import yt_dlp
+import uuid
 import os
 import warnings
-import torch
 import numpy as np
 
+import config
+import metrics
+from model_registry import registry, resolve_model
+from worker_pool import inference_pool, io_pool, reader_pool, PoolBusyError, import_inference
+from scheduler import scheduler
+from segmenter import StreamingChunker, SeamStitcher
+from audio_io import stream_pcm, decode_to_pcm, download_source
+from pipeline import UrlPipeline, UploadPipeline, recent_runs as pipeline_runs
+from job_store import job_store
+from sharded import ShardPool, plan_ranges
+from storage import storage
+from transcript_cache import transcript_cache, cache_key, file_digest, video_id
+from transcript_store import transcript_store, stream_export, EXPORTS
+from streaming import WireFormat, JobStream, sse_events, ndjson_lines
+
 warnings.filterwarnings("ignore")
-torch.set_num_threads(4)
 
 app = FastAPI()
 
+# Worker processes for sharded transcription of whole files, when enabled
+shard_pool = None
+
+# How long the server took to come up, for /status and /metrics. torch and whisper
+# are not imported by the app itself; the warm-up task loads them after startup.
+startup = {
+    "import_seconds": round(time.perf_counter() - _started, 3),
+    "ready_seconds": None,
+    "inference_import_seconds": None,
+    "warm_seconds": None,
+    "models": {},
+    "snapshots": bool(config.MODEL_SNAPSHOT_DIR),
+    "first_request_seconds": None,
+}
+warm_up_task = None
+storage_task = None
+
+async def warm_up_models():
+    """Import the inference modules, then load (and with WARMUP, exercise) each configured model"""
+    try:
+        started = time.perf_counter()
+        await import_inference()
+        startup["inference_import_seconds"] = round(time.perf_counter() - started, 3)
+        from batch_engine import warm_up
+        for name in config.WHISPER_MODELS:
+            startup["models"][name] = await inference_pool.run(warm_up, name, None, config.WARMUP)
+        startup["warm_seconds"] = round(time.perf_counter() - _started, 3)
+        print(f"Models warm {startup['warm_seconds']:.2f} seconds after start: {json.dumps(startup['models'])}")
+    except Exception as e:
+        print(f"Warm-up failed: {str(e)}")
+
+def record_first_request(received: float):
+    """Time from the first transcription request arriving to its first segment"""
+    if startup["first_request_seconds"] is None:
+        startup["first_request_seconds"] = round(time.perf_counter() - received, 3)
+        print(f"First request answered in {startup['first_request_seconds']:.2f} seconds")
+
+@app.on_event("startup")
+async def start_up():
+    global shard_pool, warm_up_task, storage_task
+    # Load configured models in the background so the server accepts connections right away
+    warm_up_task = asyncio.get_running_loop().create_task(warm_up_models())
+    
+    if config.SHARD_WORKERS > 0:
+        shard_pool = ShardPool(config.SHARD_WORKERS, config.SHARD_THREADS)
+        print(f"Sharding files over {config.SHARD_WORKERS} processes x {config.SHARD_THREADS} threads")
+    
+    # Jobs cut off by a restart can be resumed by reconnecting
+    interrupted = job_store.mark_interrupted()
+    if interrupted:
+        print(f"{interrupted} interrupted jobs can be resumed")
+    
+    # Their temporary files cannot be, so clear those and bring uploads back within the quota
+    swept = storage.sweep()
+    if swept:
+        print(f"Removed {swept} temporary workspaces left by a previous run")
+    storage_task = asyncio.get_running_loop().create_task(io_pool.run(storage.make_room))
+    
+    startup["ready_seconds"] = round(time.perf_counter() - _started, 3)
+    print(f"Ready in {startup['ready_seconds']:.2f} seconds")
+
+# Values read when /metrics is scraped
+metrics.gauge("blayze_active_jobs", "Transcription jobs admitted and not yet finished", lambda: inference_pool.active_jobs)
+metrics.gauge("blayze_live_streams", "Jobs currently being transcribed", lambda: len(live_jobs))
+metrics.gauge("blayze_pool_queue_depth", "Tasks waiting for a worker", lambda: {
+    "inference": inference_pool.status()["queue_depth"], "io": io_pool.status()["queue_depth"],
+    "reader": reader_pool.status()["queue_depth"]}, label="pool")
+metrics.gauge("blayze_scheduler_windows_queued", "Windows waiting to be batched",
+              lambda: scheduler.status()["windows_queued"])
+metrics.gauge("blayze_models_loaded", "Models resident in memory", lambda: len(registry.status()["models"]))
+metrics.gauge("blayze_transcript_cache_hits_total", "Transcript cache hits", lambda: transcript_cache.hits,
+              kind="counter")
+metrics.gauge("blayze_transcript_cache_misses_total", "Transcript cache misses", lambda: transcript_cache.misses,
+              kind="counter")
+metrics.gauge("blayze_storage_bytes", "Bytes of uploads and job workspaces on disk", storage.usage)
+metrics.gauge("blayze_startup_seconds", "Seconds from importing the app to each startup phase, and from the "
+              "first request to its first segment", lambda: {
+    phase: startup[f"{phase}_seconds"] for phase in ("import", "ready", "warm", "first_request")
+    if startup[f"{phase}_seconds"] is not None}, label="phase")
+
+@app.on_event("shutdown")
+def stop_shard_pool():
+    if shard_pool is not None:
+        shard_pool.shutdown()
+
 # Whisper uses 16kHz audio
 SAMPLE_RATE = 16000
 
-def download_youtube_audio(url: str) -> str:
-    """Download audio from YouTube video"""
-    ydl_opts = {
-        'format': 'bestaudio/best',
-        'postprocessors': [{
-            'key': 'FFmpegExtractAudio',
-            'preferredcodec': 'mp3',
-            'preferredquality': '192',
-        }],
-        'outtmpl': 'uploads/%(title)s.%(ext)s',
-        'nocheckcertificate': True
-    }
-    
-    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-        info = ydl.extract_info(url, download=True)
-        audio_file = f"uploads/{info['title']}.mp3"
-        return audio_file
+async def process_audio(audio, timing=None, start: float = 0.0, model: str = None, backend: str = None,
+                        words: bool = False):
+    """Process an audio file path, PCM array or iterator of PCM blocks and yield segments in real-time
 
-async def process_audio(audio_file: str):
-    """Process audio file and yield segments in real-time"""
+    start is where the audio begins within the recording, in seconds, when
+    resuming a job. After each chunk a progress event gives the offset up
+    to which the recording is done. model and backend default to the server
+    configuration; words adds word-level timestamps to each segment.
+    """
     print("Starting transcription process...")
-    model = whisper.load_model("base")
-    print("Model loaded, starting transcription...")
     
-    # Load audio
-    audio = whisper.load_audio(audio_file)
+    # Decode incrementally from an ffmpeg pipe so the first chunks are
+    # transcribed before the whole file has been read
+    if isinstance(audio, str):
+        blocks = stream_pcm(audio, config.DECODE_BLOCK_SECONDS, start)
+    elif isinstance(audio, np.ndarray):
+        blocks = iter([audio])
+    else:
+        blocks = audio
+    
+    try:
+        if config.CHUNKING == "context":
+            events = transcribe_in_context(blocks, timing, start, model, backend, words)
+        else:
+            events = transcribe_chunks(blocks, timing, start, model, backend, words)
+        async for event in events:
+            yield event
     
-    # Get duration and calculate chunk size (e.g., 30 seconds)
-    duration = len(audio) / SAMPLE_RATE
-    chunk_duration = 30.0  # seconds
-    chunk_size = int(SAMPLE_RATE * chunk_duration)
+    finally:
+        # Stop the ffmpeg reader if the stream ends early
+        if hasattr(blocks, "close"):
+            try:
+                blocks.close()
+            except ValueError:
+                pass  # still reading in a worker thread; closed once garbage collected
     
-    print(f"Audio duration: {duration:.2f} seconds")
-    print(f"Processing in {chunk_duration}-second chunks")
+    if timing is not None:
+        timing.finish()
+
+async def transcribe_chunks(blocks, timing, start: float, model: str, backend: str, words: bool = False):
+    """Transcribe independent chunks of PCM blocks, batched with other jobs' chunks"""
+    # Plan chunks of up to 30 seconds, cut in pauses and skipping silence
+    chunker = StreamingChunker(config.CHUNKING, overlap=config.VAD_OVERLAP, min_silence=config.VAD_MIN_SILENCE)
+    print(f"Processing {config.CHUNKING} chunks, {config.BATCH_SIZE} at a time")
     
-    # Process audio in chunks
-    for i in range(0, len(audio), chunk_size):
-        chunk = audio[i:i + chunk_size]
+    # Queue chunks a batch at a time; the scheduler may combine them with other jobs' chunks
+    batch_size = max(1, config.BATCH_SIZE)
+    stream_id = uuid.uuid4().hex
+    stitcher = SeamStitcher()
+    pending = []
+    decoding = True
+    while decoding or pending:
+        if decoding and len(pending) < batch_size:
+            with metrics.span("decode"):
+                block = await reader_pool.run(next, blocks, None)
+            if block is None:
+                decoding = False
+                pending.extend(chunker.finish())
+            else:
+                pending.extend(chunker.feed(block))
+            continue
         
-        # Pad last chunk if needed
-        if len(chunk) < chunk_size:
-            chunk = np.pad(chunk, (0, chunk_size - len(chunk)))
+        batch, pending = pending[:batch_size], pending[batch_size:]
         
-        # Transcribe chunk
-        result = model.transcribe(chunk)
+        # Transcribe the chunks in shared batches
+        started = time.perf_counter()
+        results = await scheduler.transcribe(
+            stream_id, model or config.DEFAULT_MODEL, backend or config.BACKEND, [chunk for _, chunk in batch], words)
+        if timing is not None:
+            timing.record(time.perf_counter() - started, len(batch))
         
-        # Adjust timestamp to account for chunk position
-        chunk_start_time = i / SAMPLE_RATE
-        for segment in result["segments"]:
-            segment["start"] += chunk_start_time
-            yield {
-                "type": "segment",
-                "data": {
-                    "start": segment["start"],
-                    "text": segment["text"].strip()
-                }
-            }
-            
-        print(f"Processed chunk starting at {chunk_start_time:.2f} seconds")
+        for (chunk_start, chunk), segments in zip(batch, results):
+            for event in chunk_events(stitcher, start + chunk_start / SAMPLE_RATE, len(chunk), segments):
+                yield event
+    
+    duration = chunker.samples_seen / SAMPLE_RATE
+    speech = chunker.samples_planned / SAMPLE_RATE
+    print(f"Audio duration: {duration:.2f} seconds, {speech:.2f} seconds transcribed")
 
-@app.get("/stream-transcription")
-async def stream_transcription(request: Request, url: str = None, file: str = None):
-    async def event_generator():
+async def transcribe_in_context(blocks, timing, start: float, model: str, backend: str, words: bool = False):
+    """Decode PCM blocks continuously like whisper.transcribe
+    
+    The language is detected once, each window is prompted with the text
+    before it, and the next window starts where the last complete segment
+    ended rather than a fixed 30 seconds later.
+    """
+    print("Processing audio in context, one window at a time")
+    await import_inference()
+    from batch_engine import transcribe_window
+    window_samples = 30 * SAMPLE_RATE
+    stitcher = SeamStitcher()
+    buffer = np.zeros(0, dtype=np.float32)
+    offset = 0  # samples of audio before the buffer
+    language = None
+    prompt = []
+    decoding = True
+    while decoding or len(buffer):
+        if decoding and len(buffer) < window_samples:
+            with metrics.span("decode"):
+                block = await reader_pool.run(next, blocks, None)
+            if block is None:
+                decoding = False
+            else:
+                buffer = np.concatenate([buffer, block])
+            continue
+        
+        started = time.perf_counter()
+        result = await inference_pool.run(
+            transcribe_window, model or config.DEFAULT_MODEL, buffer[:window_samples], language, prompt, backend, words)
+        if timing is not None:
+            timing.record(time.perf_counter() - started)
+        
+        if language is None:
+            language = result["language"]
+            print(f"Detected language: {language}")
+        prompt = result["prompt"]
+        
+        consumed = min(len(buffer), max(1, int(result["seconds"] * SAMPLE_RATE)))
+        for event in chunk_events(stitcher, start + offset / SAMPLE_RATE, consumed, result["segments"]):
+            yield event
+        buffer = buffer[consumed:]
+        offset += consumed
+    
+    print(f"Audio duration: {offset / SAMPLE_RATE:.2f} seconds")
+
+def chunk_events(stitcher: SeamStitcher, chunk_start_time: float, length: int, segments: list):
+    """Segment events for one transcribed chunk, then a progress event for its end"""
+    # Adjust timestamp to account for chunk position
+    for segment in segments:
+        segment["start"] += chunk_start_time
+        segment["end"] += chunk_start_time
+        for word in segment.get("words", ()):
+            word["start"] = round(word["start"] + chunk_start_time, 2)
+            word["end"] = round(word["end"] + chunk_start_time, 2)
+    
+    # Drop text repeated in the overlap with the previous chunk
+    for segment in stitcher.feed(segments):
+        data = {
+            "start": segment["start"],
+            "end": segment["end"],
+            "text": segment["text"]
+        }
+        if "words" in segment:
+            data["words"] = segment["words"]
+        yield {"type": "segment", "data": data}
+    
+    metrics.audio_seconds.inc(length / SAMPLE_RATE)
+    yield {"type": "progress", "data": {"offset": chunk_start_time + length / SAMPLE_RATE}}
+    print(f"Processed chunk starting at {chunk_start_time:.2f} seconds")
+
+async def process_audio_sharded(path: str, start: float = 0.0, model: str = None, backend: str = None,
+                                words: bool = False):
+    """Process an audio file with its chunk batches spread over the shard worker processes
+    
+    The file is decoded once to raw PCM that every worker memory-maps.
+    Batches finish in any order but are yielded in timestamp order, each
+    as soon as every batch before it is done.
+    """
+    workspace = storage.workspace(temporary=True)
+    try:
+        # Raw PCM is 64 kB a second, up to 8x the source for audio of 64 kbit/s and more
+        pcm_path = workspace.scratch("audio.pcm", 8 * os.path.getsize(path))
+        try:
+            pcm = await io_pool.run(decode_to_pcm, path, pcm_path, start)
+        except RuntimeError as e:
+            # Lower bitrates expand further and can fill the RAM-backed area; decode to disk instead
+            if pcm_path == workspace.file("audio.pcm") or "No space left on device" not in str(e):
+                raise
+            print(f"Scratch area full, decoding to {workspace.path} instead")
+            if os.path.exists(pcm_path):
+                os.remove(pcm_path)
+            pcm_path = workspace.file("audio.pcm")
+            pcm = await io_pool.run(decode_to_pcm, path, pcm_path, start)
+        ranges = await io_pool.run(plan_ranges, pcm, config.CHUNKING, config.VAD_OVERLAP, config.VAD_MIN_SILENCE)
+        print(f"Processing {len(ranges)} {config.CHUNKING} chunks on {shard_pool.workers} worker processes")
+        
+        stitcher = SeamStitcher()
+        batches = shard_pool.transcribe(
+            model or config.DEFAULT_MODEL, pcm_path, ranges, max(1, config.BATCH_SIZE), backend, words)
         try:
-            audio_file = None
-            if url:
-                print(f"Starting download for URL: {url}")
-                audio_file = download_youtube_audio(url)
-            elif file:
-                print(f"Processing uploaded file: {file}")
-                audio_file = file
+            async for batch, results in batches:
+                for (chunk_start, chunk_end), segments in zip(batch, results):
+                    for event in chunk_events(stitcher, start + chunk_start / SAMPLE_RATE, chunk_end - chunk_start, segments):
+                        yield event
+        finally:
+            await batches.aclose()
+        
+        print(f"Audio duration: {len(pcm) / SAMPLE_RATE:.2f} seconds")
+    finally:
+        workspace.release()
+
+def transcription_options(backend: str, words: bool = False) -> dict:
+    """Settings that change transcription output, for cache keys"""
+    return {
+        "backend": backend,
+        "word_timestamps": words,
+        "chunking": config.CHUNKING,
+        "vad_overlap": config.VAD_OVERLAP,
+        "vad_min_silence": config.VAD_MIN_SILENCE,
+    }
+
+def parse_resume(job: str, last_event_id: str):
+    """(job_id, last_seq) from a ?job= parameter or an SSE Last-Event-ID header"""
+    if last_event_id:
+        job_id, _, seq = last_event_id.rpartition(":")
+        if job_id and seq.isdigit():
+            return job_id, int(seq)
+    return job, 0
+
+# Stop flags of jobs currently being transcribed, by job id
+live_jobs = {}
+
+async def take_over_job(job_id: str) -> asyncio.Event:
+    """Stop any earlier stream still running this job and register a new one"""
+    previous = live_jobs.get(job_id)
+    if previous is not None:
+        previous.set()
+        for _ in range(300):
+            if job_id not in live_jobs:
+                break
+            await asyncio.sleep(0.1)
+    stop = asyncio.Event()
+    live_jobs[job_id] = stop
+    return stop
+
+def release_job(job_id: str, stop: asyncio.Event):
+    if live_jobs.get(job_id) is stop:
+        del live_jobs[job_id]
+
+async def run_job(job_id: str, audio, timing=None, start: float = 0.0, model: str = None, backend: str = None,
+                  words: bool = False):
+    """Transcribe for a job and yield (seq, segment) pairs, each chunk's only once it is checkpointed
+
+    A client's Last-Event-ID then never runs ahead of what is stored, so
+    a resumed job does not send a half-sent chunk again under new ids.
+    """
+    # Spans and profiles of everything below are attributed to this job
+    metrics.current_job.set(job_id)
+    seq = await io_pool.run(job_store.last_seq, job_id)
+    pending = []
+    if shard_pool is not None and isinstance(audio, str) and config.CHUNKING != "context":
+        events = process_audio_sharded(audio, start, model, backend, words)
+    else:
+        events = process_audio(audio, timing, start, model, backend, words)
+    try:
+        async for event in events:
+            if event["type"] == "progress":
+                await io_pool.run(job_store.checkpoint, job_id, pending, event["data"]["offset"])
+                for segment in pending:
+                    yield segment
+                pending = []
+                continue
             
-            if not audio_file:
-                raise ValueError("No URL or file provided")
+            seq += 1
+            pending.append((seq, event["data"]))
+    finally:
+        if config.PROFILE_DIR:
+            metrics.dump_profile(job_id)
+
+def record_pipeline(pipeline, job_id: str):
+    """Keep a finished pipeline's timings for /status and time its input stage as a span"""
+    summary = pipeline.summary()
+    pipeline_runs.append(summary)
+    for stage in ("download", "upload"):
+        if stage in pipeline.stats:
+            metrics.record_span(stage, pipeline.stats[stage].busy_seconds, job_id)
+    return summary
+
+async def emit(message, segments: int = 1):
+    """Yield one stream message, timing how long the response takes to send it"""
+    with metrics.span("sse_emit"):
+        yield message
+    metrics.segments_emitted.inc(segments)
+
+async def finish_job(job_id: str, key: str = None):
+    await io_pool.run(job_store.set_status, job_id, "complete")
+    if key:
+        segments = await io_pool.run(job_store.segments, job_id)
+        await io_pool.run(transcript_cache.put, key, [data for _, data in segments])
+
+def interrupt_job(job_id: str):
+    """Record a stream that ended before its job did
+
+    Called from tasks that may already be cancelled, so it does not await.
+    """
+    job_store.set_status(job_id, "interrupted")
+    metrics.jobs_finished.inc(outcome="interrupted")
+
+async def stream_job(job_id: str, stream: JobStream, fmt: WireFormat, key: str = None, received: float = None):
+    """Messages for a running job's segments and its outcome, recording how the job ended"""
+    ended = False
+    try:
+        async for kind, detail in stream.batches(fmt.window):
+            if kind == "segments":
+                if received is not None:
+                    record_first_request(received)
+                    received = None
+                messages = fmt.segments(job_id, detail)
+                for message in messages:
+                    async for sent in emit(message, len(detail) // len(messages)):
+                        yield sent
+            elif kind == "complete":
+                ended = True
+                await finish_job(job_id, key)
+                metrics.jobs_finished.inc(outcome="complete")
+                for message in fmt.complete():
+                    yield message
+            elif kind == "error":
+                ended = True
+                await io_pool.run(job_store.set_status, job_id, "error", detail)
+                metrics.jobs_finished.inc(outcome="error")
+                for message in fmt.error(detail):
+                    yield message
+            else:
+                ended = True
+                interrupt_job(job_id)
+                for message in fmt.interrupted():
+                    yield message
+    except (asyncio.CancelledError, GeneratorExit):
+        # The response closed the stream, e.g. because the client went away
+        if not ended:
+            interrupt_job(job_id)
+        raise
+    finally:
+        stream.cancel()
+
+async def open_stream(request: Request, fmt: WireFormat, url: str, file: str, job: str, model: str, backend: str,
+                      words: bool):
+    """Admit a transcription stream and return its messages, or an error response
+
+    Used by the SSE and NDJSON endpoints, which differ only in how the
+    (event id, payload) messages are written out.
+    """
+    received = time.perf_counter()
+    await import_inference()  # resolve_model imports the backends
+    try:
+        model, backend = resolve_model(model, backend)
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"detail": str(e)}), None
+    try:
+        admission = inference_pool.admit()
+    except PoolBusyError as e:
+        return JSONResponse(status_code=503, content={"detail": str(e)}, headers={"Retry-After": "5"}), None
+
+    job_id, last_seq = parse_resume(job, request.headers.get("last-event-id"))
+    words = config.WORD_TIMESTAMPS if words is None else words
+
+    async def messages():
+        nonlocal job_id, model, backend, words
+        pipeline = None
+        stop = None
+        workspace = None
+        pinned = None
+        try:
+            if job_id:
+                # Resume: replay checkpointed segments, then carry on from the saved offset
+                if await io_pool.run(job_store.get, job_id) is None:
+                    # Checked before taking over, so unknown ids never reach live_jobs
+                    job_id = None
+                    raise ValueError("Unknown job")
+                stop = await take_over_job(job_id)
+                # Read again, as the stream taken over checkpoints its last chunk as it stops
+                record = await io_pool.run(job_store.get, job_id)
+                for message in fmt.job(job_id) + fmt.stored(job_id, await io_pool.run(job_store.segments, job_id, last_seq)):
+                    yield message
+                if record["status"] == "complete":
+                    for message in fmt.complete():
+                        yield message
+                    return
+                kind, source, start = record["kind"], record["source"], record["next_offset"]
+                model, backend = record["model"], record["options"].get("backend", "fp32")
+                words = record["options"].get("word_timestamps", False)
+                key = record["options"].get("cache_key")
+                await io_pool.run(job_store.set_status, job_id, "running")
+                print(f"Resuming job {job_id} at {start:.2f} seconds")
+            else:
+                if not url and not file:
+                    raise ValueError("No URL or file provided")
+                kind, source, start = ("url", url, 0.0) if url else ("file", file, 0.0)
                 
-            print(f"Processing file: {audio_file}")
-            
-            async for segment in process_audio(audio_file):
-                if await request.is_disconnected():
-                    print("Client disconnected")
-                    break
+                # Replay a finished transcript of the same audio, model and options
+                key = None
+                if config.TRANSCRIPT_CACHE:
+                    digest = await io_pool.run(video_id, url) if url else await io_pool.run(file_digest, file)
+                    key = cache_key(digest, model, transcription_options(backend, words))
+                    cached = await io_pool.run(transcript_cache.get, key)
+                    if cached is not None:
+                        # Still recorded as a job, so the transcript can be exported
+                        print(f"Replaying {len(cached)} cached segments")
+                        options = dict(transcription_options(backend, words), cache_key=key)
+                        job_id = await io_pool.run(job_store.create, kind, source, model, options)
+                        await io_pool.run(job_store.store_transcript, job_id, cached)
+                        for message in fmt.job(job_id) + fmt.stored(job_id, list(enumerate(cached, 1))) + fmt.complete():
+                            yield message
+                        return
                 
-                yield {"event": "message", "data": json.dumps(segment)}
+                options = dict(transcription_options(backend, words), cache_key=key)
+                job_id = await io_pool.run(job_store.create, kind, source, model, options)
+                stop = await take_over_job(job_id)
+                for message in fmt.job(job_id):
+                    yield message
             
-            print("Cleaning up audio file...")
-            if url:  # Only remove downloaded files, not uploaded ones
-                os.remove(audio_file)
+            if kind == "url":
+                # Downloads go to a workspace of their own, deleted when the stream ends
+                workspace = storage.workspace(temporary=True)
+            else:
+                # Keep quota cleanup away from an uploaded file while it is transcribed
+                pinned = storage.pin(source)
+                if not os.path.exists(source):
+                    raise ValueError("File not found; uploads not in use are removed to stay within the storage quota")
             
-            yield {"event": "message", "data": json.dumps({'type': 'complete'})}
+            if kind == "url" and shard_pool is not None:
+                # Sharding needs the whole file, so download it before transcribing
+                print(f"Downloading URL for sharded transcription: {source}")
+                audio, timing = await io_pool.run(download_source, source, workspace.path), None
+            elif kind == "url":
+                # Download, decode and inference run as concurrent stages
+                print(f"Starting pipeline for URL: {source}")
+                pipeline = UrlPipeline(source, block_seconds=config.DECODE_BLOCK_SECONDS, outdir=workspace.path,
+                                       start=start)
+                audio, timing = pipeline.start(), pipeline.stats["inference"]
+            else:
+                print(f"Processing uploaded file: {source}")
+                audio, timing = source, None
+            
+            # Inference runs as its own task, cancelled the moment the client goes away
+            stream = JobStream(run_job(job_id, audio, timing, start, model, backend, words), stop)
+            stream.watch_disconnect(request)
+            async for message in stream_job(job_id, stream, fmt, key, received):
+                yield message
             
         except Exception as e:
             print(f"Error occurred: {str(e)}")
-            yield {"event": "message", "data": json.dumps({'type': 'error', 'message': str(e)})}
+            metrics.jobs_finished.inc(outcome="error")
+            if job_id:
+                await io_pool.run(job_store.set_status, job_id, "error", str(e))
+            for message in fmt.error(str(e)):
+                yield message
+        finally:
+            if pipeline is not None:
+                # Stops any stage still running and removes temporary downloads
+                pipeline.cancel()
+                summary = record_pipeline(pipeline, job_id)
+                print(f"Pipeline timings: {json.dumps(summary['stages'])}")
+            if workspace is not None:
+                workspace.release()
+            storage.unpin(pinned)
+            if stop is not None:
+                release_job(job_id, stop)
+            admission.release()
+
+    return messages(), admission
+
+@app.get("/stream-transcription")
+async def stream_transcription(request: Request, url: str = None, file: str = None, job: str = None,
+                               model: str = None, backend: str = None, words: bool = None, compact: bool = False):
+    """Stream transcript segments as server-sent events
+
+    compact=1 coalesces segments arriving within STREAM_COALESCE_MS into one
+    event with short field names (see streaming.WireFormat).
+    """
+    fmt = WireFormat(compact)
+    messages, admission = await open_stream(request, fmt, url, file, job, model, backend, words)
+    if admission is None:
+        return messages
+    return EventSourceResponse(sse_events(messages, fmt), background=BackgroundTask(admission.release))
 
-    return EventSourceResponse(event_generator())
+@app.get("/stream-transcription.ndjson")
+async def stream_transcription_ndjson(request: Request, url: str = None, file: str = None, job: str = None,
+                                      model: str = None, backend: str = None, words: bool = None,
+                                      compact: bool = False):
+    """The same stream as newline-delimited JSON, gzip-compressed when the client accepts it"""
+    fmt = WireFormat(compact)
+    messages, admission = await open_stream(request, fmt, url, file, job, model, backend, words)
+    if admission is None:
+        return messages
+    gzip = "gzip" in request.headers.get("accept-encoding", "")
+    headers = {"Content-Encoding": "gzip", "Vary": "Accept-Encoding"} if gzip else {}
+    return StreamingResponse(ndjson_lines(messages, fmt, gzip), media_type="application/x-ndjson", headers=headers,
+                             background=BackgroundTask(admission.release))
+
+@app.get("/status")
+async def status():
+    return {
+        "models": registry.status(),
+        "pools": {"inference": inference_pool.status(), "io": io_pool.status(), "reader": reader_pool.status()},
+        "scheduler": scheduler.status(),
+        "shards": shard_pool.status() if shard_pool is not None else None,
+        "transcript_cache": transcript_cache.status(),
+        "transcript_store": transcript_store.status(),
+        "jobs": job_store.status(),
+        "storage": storage.status(),
+        "startup": startup,
+        "recent_pipelines": list(pipeline_runs),
+    }
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/jobs/{job_id}/spans")
+async def job_spans(job_id: str):
+    """Recent timing spans of one job, with totals per stage"""
+    spans = metrics.job_spans(job_id)
+    totals = {}
+    for span in spans:
+        totals[span["stage"]] = round(totals.get(span["stage"], 0.0) + span["seconds"], 6)
+    return {"job": job_id, "totals": totals, "spans": spans}
+
+@app.get("/jobs/{job_id}/transcript.{fmt}")
+async def export_transcript(job_id: str, fmt: str, words: bool = False):
+    """Stream a job's transcript as SRT, VTT, TXT or JSON from the stored segments
+
+    words=1 gives one SRT/VTT/TXT cue per word when the job has word timestamps.
+    A job still running exports what has been checkpointed so far.
+    """
+    if fmt not in EXPORTS:
+        raise HTTPException(status_code=400, detail=f"Unknown format {fmt!r}; choose from {', '.join(EXPORTS)}")
+    transcript = await io_pool.run(transcript_store.get, job_id)
+    if transcript is None:
+        raise HTTPException(status_code=404, detail="Unknown job")
+    return StreamingResponse(
+        stream_export(transcript, fmt, words),
+        media_type=EXPORTS[fmt][1],
+        headers={"Content-Disposition": f'attachment; filename="transcript-{job_id[:8]}.{fmt}"'},
+    )
 
 @app.get("/", response_class=HTMLResponse)
 async def home():
@@ -206,16 +742,37 @@ async def home():
                                 </svg>
                                 Download as JSON
                             </button>
+                            <button 
+                                id="download-srt"
+                                class="flex items-center gap-2 px-4 py-2 bg-purple-600 text-white rounded-md hover:bg-purple-700"
+                            >
+                                <svg class="w-5 h-5" fill="none" stroke="currentColor" viewBox="0 0 24 24">
+                                    <path stroke-linecap="round" stroke-linejoin="round" stroke-width="2" d="M4 16v1a3 3 0 003 3h10a3 3 0 003-3v-1m-4-4l-4 4m0 0l-4-4m4 4V4"/>
+                                </svg>
+                                Download as SRT
+                            </button>
+                            <button 
+                                id="download-vtt"
+                                class="flex items-center gap-2 px-4 py-2 bg-gray-600 text-white rounded-md hover:bg-gray-700"
+                            >
+                                <svg class="w-5 h-5" fill="none" stroke="currentColor" viewBox="0 0 24 24">
+                                    <path stroke-linecap="round" stroke-linejoin="round" stroke-width="2" d="M4 16v1a3 3 0 003 3h10a3 3 0 003-3v-1m-4-4l-4 4m0 0l-4-4m4 4V4"/>
+                                </svg>
+                                Download as VTT
+                            </button>
                         </div>
                     </div>
                 </div>
             </div>
 
             <script>
-                let transcriptSegments = [];
+                // Exports are served from the job's stored transcript, so the page only counts segments
+                let currentJobId = null;
+                let segmentCount = 0;
                 
-                document.getElementById("download-txt").addEventListener("click", () => downloadTranscript("txt"));
-                document.getElementById("download-json").addEventListener("click", () => downloadTranscript("json"));
+                for (const format of ["txt", "json", "srt", "vtt"]) {
+                    document.getElementById(`download-${format}`).addEventListener("click", () => downloadTranscript(format));
+                }
                 
                 document.getElementById("transcribe-form").addEventListener("submit", function(e) {
                     e.preventDefault();
@@ -229,7 +786,8 @@ async def home():
                     
                     transcriptionDiv.innerHTML = "";
                     downloadButtons.classList.add("hidden");
-                    transcriptSegments = [];
+                    currentJobId = null;
+                    segmentCount = 0;
                     
                     btn.disabled = true;
                     spinner.classList.remove("hidden");
@@ -242,8 +800,10 @@ async def home():
                         try {
                             const data = JSON.parse(event.data);
                             
-                            if (data.type === "segment" && data.data) {
-                                transcriptSegments.push(data.data);
+                            if (data.type === "job") {
+                                currentJobId = data.data.id;
+                            } else if (data.type === "segment" && data.data) {
+                                segmentCount++;
                                 
                                 const segmentDiv = document.createElement("div");
                                 segmentDiv.className = "p-4 bg-gray-50 rounded-lg mb-2";
@@ -257,14 +817,14 @@ async def home():
                                     top: document.body.scrollHeight,
                                     behavior: "smooth"
                                 });
-                            } else if (data.type === "complete") {
-                                console.log("Transcription complete, showing download buttons");
+                            } else if (data.type === "complete" || data.type === "interrupted") {
+                                console.log(`Transcription ${data.type}, showing download buttons`);
                                 eventSource.close();
                                 btn.disabled = false;
                                 spinner.classList.add("hidden");
                                 btnText.textContent = "Transcribe";
                                 
-                                if (transcriptSegments.length > 0) {
+                                if (segmentCount > 0 && currentJobId) {
                                     downloadButtons.classList.remove("hidden");
                                 }
                             }
@@ -291,48 +851,17 @@ async def home():
                 }
                 
                 function downloadTranscript(format) {
-                    console.log("Downloading transcript in format:", format);
-                    console.log("Number of segments:", transcriptSegments.length);
-                    
-                    if (transcriptSegments.length === 0) {
-                        console.error("No transcript segments to download");
+                    if (!currentJobId) {
+                        console.error("No transcript to download");
                         return;
                     }
                     
-                    let content;
-                    let filename;
-                    let mimeType;
-                    
-                    if (format === "txt") {
-                        content = transcriptSegments
-                            .map(segment => `[${formatTimestamp(segment.start)}] ${segment.text}`)
-                            .join("\\n");
-                        filename = "transcript.txt";
-                        mimeType = "text/plain";
-                    } else {
-                        content = JSON.stringify({
-                            segments: transcriptSegments,
-                            metadata: {
-                                totalSegments: transcriptSegments.length,
-                                generatedAt: new Date().toISOString()
-                            }
-                        }, null, 2);
-                        filename = "transcript.json";
-                        mimeType = "application/json";
-                    }
-                    
-                    console.log("Creating download with content length:", content.length);
-                    
-                    const blob = new Blob([content], { type: mimeType });
-                    const url = window.URL.createObjectURL(blob);
                     const a = document.createElement("a");
                     a.style.display = "none";
-                    a.href = url;
-                    a.download = filename;
+                    a.href = `/jobs/${currentJobId}/transcript.${format}`;
                     document.body.appendChild(a);
                     a.click();
                     document.body.removeChild(a);
-                    window.URL.revokeObjectURL(url);
                 }
 
                 document.getElementById('url-tab').addEventListener('click', () => {
@@ -362,71 +891,76 @@ async def home():
                     // Clear previous transcription and hide download buttons
                     transcriptionDiv.innerHTML = '';
                     downloadButtons.classList.add('hidden');
-                    transcriptSegments = [];
+                    currentJobId = null;
+                    segmentCount = 0;
                     
                     btn.disabled = true;
                     spinner.classList.remove('hidden');
                     btnText.textContent = 'Transcribing...';
                     
-                    const formData = new FormData(form);
+                    const file = new FormData(form).get('file');
                     
                     try {
-                        // First upload the file
-                        const uploadResponse = await fetch('/upload-file', {
+                        // Upload and transcribe in one request; the server decodes while the file arrives
+                        const response = await fetch(`/upload-and-transcribe?filename=${encodeURIComponent(file.name)}`, {
                             method: 'POST',
-                            body: formData
+                            headers: { 'Content-Type': 'application/octet-stream' },
+                            body: file
                         });
                         
-                        if (!uploadResponse.ok) {
+                        if (!response.ok) {
                             throw new Error('File upload failed');
                         }
                         
-                        const uploadResult = await uploadResponse.json();
-                        
-                        // Then start the transcription stream
-                        const eventSource = new EventSource(`/stream-transcription?file=${encodeURIComponent(uploadResult.filename)}`);
-                        
-                        eventSource.onmessage = function(event) {
-                            try {
-                                const data = JSON.parse(event.data);
+                        // Read the server-sent events from the response body
+                        const reader = response.body.getReader();
+                        const decoder = new TextDecoder();
+                        let buffer = '';
+                        while (true) {
+                            const { done, value } = await reader.read();
+                            if (done) break;
+                            buffer = (buffer + decoder.decode(value, { stream: true })).replace(/\r\n/g, '\n');
+                            
+                            const events = buffer.split('\n\n');
+                            buffer = events.pop();
+                            for (const event of events) {
+                                const line = event.split('\n').find(l => l.startsWith('data:'));
+                                if (!line) continue;
                                 
-                                if (data.type === 'segment' && data.data) {
-                                    transcriptSegments.push(data.data);
-                                    
-                                    const segmentDiv = document.createElement('div');
-                                    segmentDiv.className = 'p-4 bg-gray-50 rounded-lg mb-2';
-                                    segmentDiv.innerHTML = `
-                                        <span class="text-gray-500 mr-2">[${formatTimestamp(data.data.start)}]</span>
-                                        <span>${data.data.text}</span>
-                                    `;
-                                    transcriptionDiv.appendChild(segmentDiv);
-                                    
-                                    window.scrollTo({
-                                        top: document.body.scrollHeight,
-                                        behavior: 'smooth'
-                                    });
-                                } else if (data.type === 'complete') {
-                                    eventSource.close();
-                                    btn.disabled = false;
-                                    spinner.classList.add('hidden');
-                                    btnText.textContent = 'Transcribe';
+                                try {
+                                    const data = JSON.parse(line.slice(5));
                                     
-                                    if (transcriptSegments.length > 0) {
-                                        downloadButtons.classList.remove('hidden');
+                                    if (data.type === 'job') {
+                                        currentJobId = data.data.id;
+                                    } else if (data.type === 'segment' && data.data) {
+                                        segmentCount++;
+                                        
+                                        const segmentDiv = document.createElement('div');
+                                        segmentDiv.className = 'p-4 bg-gray-50 rounded-lg mb-2';
+                                        segmentDiv.innerHTML = `
+                                            <span class="text-gray-500 mr-2">[${formatTimestamp(data.data.start)}]</span>
+                                            <span>${data.data.text}</span>
+                                        `;
+                                        transcriptionDiv.appendChild(segmentDiv);
+                                        
+                                        window.scrollTo({
+                                            top: document.body.scrollHeight,
+                                            behavior: 'smooth'
+                                        });
                                     }
+                                } catch (error) {
+                                    console.error('Error processing message:', error);
                                 }
-                            } catch (error) {
-                                console.error('Error processing message:', error);
                             }
-                        };
+                        }
+                        
+                        btn.disabled = false;
+                        spinner.classList.add('hidden');
+                        btnText.textContent = 'Transcribe';
                         
-                        eventSource.onerror = function(error) {
-                            console.error('EventSource error:', error);
-                            eventSource.close();
-                            btn.disabled = false;
-                            spinner.classList.add('hidden');
-                            btnText.textContent = 'Transcribe';
-                        };
+                        if (segmentCount > 0 && currentJobId) {
+                            downloadButtons.classList.remove('hidden');
+                        }
                     } catch (error) {
                         console.error('Upload error:', error);
                         btn.disabled = false;
@@ -439,17 +973,203 @@ async def home():
     </html>
     '''
 
+UPLOAD_BLOCK_BYTES = 1024 * 1024
+
+def upload_length(request: Request) -> int:
+    length = request.headers.get("content-length")
+    return int(length) if length is not None and length.isdigit() else 0
+
+def upload_too_large(request: Request) -> bool:
+    return upload_length(request) > config.MAX_UPLOAD_MB * 2**20
+
+async def make_room(request: Request):
+    """Clear old uploads until this one fits in the storage quota, or reject it"""
+    if not await io_pool.run(storage.make_room, upload_length(request)):
+        raise HTTPException(status_code=507, detail="Storage is full, please try again shortly")
+
+async def save_upload(request: Request, workspace) -> str:
+    """Write the "file" field of a multipart body into the workspace as it arrives; returns its path
+
+    Parsed here rather than by Starlette, which spools the whole body to a
+    temporary file outside the storage quota before the size can be checked.
+    """
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or b"boundary" not in params:
+        raise HTTPException(status_code=400, detail="Expected a multipart/form-data upload")
+    
+    # The parser's callbacks queue (event, bytes) pairs, handled after each block of the body
+    events = []
+    
+    def on(event):
+        return lambda *args: events.append((event, args[0][args[1]:args[2]] if args else b""))
+    
+    parser = MultipartParser(params[b"boundary"], {
+        "on_part_begin": on("part"),
+        "on_header_field": on("field"),
+        "on_header_value": on("value"),
+        "on_header_end": on("header"),
+        "on_headers_finished": on("headers"),
+        "on_part_data": on("data"),
+        "on_part_end": on("end"),
+    })
+    file_path = None
+    saved = None
+    writing = False
+    headers, field, value = {}, b"", b""
+    size = 0
+    try:
+        async for data in request.stream():
+            size += len(data)
+            if size > config.MAX_UPLOAD_MB * 2**20:
+                raise HTTPException(status_code=413, detail="File too large")
+            parser.write(data)
+            for event, data in events:
+                if event == "part":
+                    headers, field, value = {}, b"", b""
+                elif event == "field":
+                    field += data
+                elif event == "value":
+                    value += data
+                elif event == "header":
+                    headers[field.lower()] = value
+                    field, value = b"", b""
+                elif event == "headers":
+                    _, options = parse_options_header(headers.get(b"content-disposition", b""))
+                    # Only the first "file" field is kept; other fields are skipped
+                    writing = file_path is None and options.get(b"name") == b"file" and b"filename" in options
+                    if writing:
+                        file_path = workspace.file(options[b"filename"].decode("utf-8", "replace"))
+                        saved = open(file_path, "wb")
+                elif event == "data" and writing:
+                    saved.write(data)
+                elif event == "end" and writing:
+                    writing = False
+                    saved.close()
+            events.clear()
+        parser.finalize()
+    except MultipartParseError as e:
+        raise HTTPException(status_code=400, detail=f"Malformed upload: {str(e)}")
+    finally:
+        if saved is not None:
+            saved.close()
+    if file_path is None:
+        raise HTTPException(status_code=400, detail="No file in the upload")
+    return file_path
+
 @app.post("/upload-file")
-async def upload_file(file: UploadFile = File(...)):
-    # Save uploaded file
-    file_path = f"uploads/{file.filename}"
-    with open(file_path, "wb") as buffer:
-        content = await file.read()
-        buffer.write(content)
+async def upload_file(request: Request):
+    """Save a multipart upload's "file" field, in blocks as it arrives, for ?file="""
+    if upload_too_large(request):
+        raise HTTPException(status_code=413, detail="File too large")
+    await make_room(request)
     
+    # A workspace of its own, so uploads with the same name never collide
+    workspace = storage.workspace()
+    try:
+        file_path = await save_upload(request, workspace)
+    except Exception:
+        workspace.release(keep=False)
+        raise
+    
+    workspace.release()
     return {"filename": file_path}
 
+@app.post("/upload-and-transcribe")
+async def upload_and_transcribe(request: Request, filename: str = "upload", model: str = None, backend: str = None,
+                               words: bool = None, compact: bool = False):
+    """Transcribe a raw request body, decoding it while it is still being uploaded
+
+    The upload is saved alongside in a workspace of its own, so an
+    interrupted stream can be resumed with /stream-transcription?job=<id>.
+    """
+    received = time.perf_counter()
+    if upload_too_large(request):
+        raise HTTPException(status_code=413, detail="File too large")
+    await import_inference()  # resolve_model imports the backends
+    try:
+        model, backend = resolve_model(model, backend)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    await make_room(request)
+    try:
+        admission = inference_pool.admit()
+    except PoolBusyError as e:
+        return JSONResponse(status_code=503, content={"detail": str(e)}, headers={"Retry-After": "5"})
+    
+    words = config.WORD_TIMESTAMPS if words is None else words
+    workspace = storage.workspace()
+    file_path = workspace.file(filename)
+    job_id = await io_pool.run(job_store.create, "file", file_path, model, transcription_options(backend, words))
+    stop_flag = await take_over_job(job_id)
+    pipeline = UploadPipeline(block_seconds=config.DECODE_BLOCK_SECONDS)
+    fmt = WireFormat(compact)
+    # Unbounded: the response, and so reading from the queue, only starts once the body is in
+    stream = JobStream(run_job(job_id, pipeline.start(), pipeline.stats["inference"], 0.0, model, backend, words),
+                       stop_flag, maxsize=0)
+    
+    stopped = False
+    
+    def stop(keep: bool = True):
+        nonlocal stopped
+        if stopped:
+            return
+        stopped = True
+        stream.cancel()
+        pipeline.cancel()
+        record_pipeline(pipeline, job_id)
+        release_job(job_id, stop_flag)
+        admission.release()
+        # The upload stays for resuming unless it never arrived whole or could not be transcribed
+        workspace.release(keep=keep and stream.outcome != "error")
+    
+    try:
+        size = 0
+        with open(file_path, "wb") as saved:
+            async for data in request.stream():
+                size += len(data)
+                if size > config.MAX_UPLOAD_MB * 2**20:
+                    raise HTTPException(status_code=413, detail="File too large")
+                saved.write(data)
+                await pipeline.feed(data)
+        await pipeline.end()
+    except Exception as e:
+        stop(keep=False)
+        # A decoder that gave up, e.g. on a file ffmpeg cannot read, is the client's error and says why
+        error = pipeline.error if isinstance(pipeline.error, RuntimeError) else e
+        await io_pool.run(job_store.set_status, job_id, "error", f"Upload failed: {str(error)}")
+        metrics.jobs_finished.inc(outcome="error")
+        if error is e:
+            raise
+        raise HTTPException(status_code=400, detail=str(error))
+    
+    # Replay a cached transcript if this exact file was seen before
+    key = None
+    if config.TRANSCRIPT_CACHE:
+        key = cache_key(f"sha256:{pipeline.digest.hexdigest()}", model, transcription_options(backend, words))
+        cached = await io_pool.run(transcript_cache.get, key)
+        if cached is not None:
+            stop()
+            await io_pool.run(job_store.store_transcript, job_id, cached)
+            
+            async def replay():
+                for message in fmt.job(job_id) + fmt.stored(job_id, list(enumerate(cached, 1))) + fmt.complete():
+                    yield message
+            
+            return EventSourceResponse(sse_events(replay(), fmt))
+    
+    stream.watch_disconnect(request)
+    
+    async def messages():
+        try:
+            for message in fmt.job(job_id):
+                yield message
+            async for message in stream_job(job_id, stream, fmt, key, received):
+                yield message
+        finally:
+            stop()
+    
+    return EventSourceResponse(sse_events(messages(), fmt), background=BackgroundTask(stop))
+
 if __name__ == "__main__":
-    os.makedirs("uploads", exist_ok=True)
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
@@ -1,12 +1,16 @@
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-import whisper
-import yt_dlp
 import asyncio
 import os
 from dotenv import load_dotenv
 from transcribe import compress_audio, transcribe_audio
+import config
+from model_registry import registry, resolve_model
+from storage import storage
+from audio_io import download_source
+from transcript_cache import transcript_cache, cache_key, file_digest, video_id
+from worker_pool import inference_pool, io_pool, transcribe_chunk, PoolBusyError, import_inference
 
 app = FastAPI()
 
@@ -19,39 +23,68 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.on_event("startup")
+def preload_models():
+    registry.preload()
+
 class TranscriptionRequest(BaseModel):
     url: str
+    model: str = None
+    backend: str = None
+    words: bool = False
 
 @app.post("/api/transcribe")
 async def transcribe(request: TranscriptionRequest):
+    await import_inference()  # resolve_model imports the backends
+    try:
+        model, backend = resolve_model(request.model, request.backend)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    try:
+        admission = inference_pool.admit()
+    except PoolBusyError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+
+    workspace = None
     try:
+        is_youtube = "youtube.com" in request.url or "youtu.be" in request.url
+
+        # Return a cached transcript of the same audio and model
+        key = None
+        if config.TRANSCRIPT_CACHE:
+            # Hash local files; key remote media by id or URL, as ffmpeg reads those itself
+            digest = file_digest if not is_youtube and os.path.isfile(request.url) else video_id
+            source = await io_pool.run(digest, request.url)
+            key = cache_key(source, model, {"pipeline": "api", "backend": backend, "word_timestamps": request.words})
+            cached = await io_pool.run(transcript_cache.get, key)
+            if cached is not None:
+                return cached
+
         # Download audio if it's a YouTube URL
-        if "youtube.com" in request.url or "youtu.be" in request.url:
-            ydl_opts = {
-                'format': 'bestaudio/best',
-                'postprocessors': [{
-                    'key': 'FFmpegExtractAudio',
-                    'preferredcodec': 'mp3',
-                }]
-            }
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                info = ydl.extract_info(request.url, download=True)
-                audio_path = info['id'] + ".mp3"
+        if is_youtube:
+            # Into a workspace of its own, deleted once the transcript is back
+            workspace = storage.workspace(temporary=True)
+            audio_path = await io_pool.run(download_source, request.url, workspace.path)
         else:
             # Handle direct video/audio file uploads
             audio_path = request.url
 
-        # Load Whisper model
-        model = whisper.load_model("base")
-        
-        # Transcribe audio
-        result = model.transcribe(audio_path)
+        # Transcribe audio with the shared Whisper model, off the event loop
+        result = await inference_pool.run(transcribe_chunk, model, audio_path, backend,
+                                           word_timestamps=request.words)
+
+        if key:
+            await io_pool.run(transcript_cache.put, key, result["segments"])
         
         # Return segments with timestamps
         return result["segments"]
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e)) 
+    finally:
+        if workspace is not None:
+            workspace.release()
+        admission.release()
 
 load_dotenv()  # Load environment variables from .env file
 api_key = os.getenv('OPENAI_API_KEY') 
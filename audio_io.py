@@ -0,0 +1,67 @@
+import os
+import subprocess
+
+import numpy as np
+
+SAMPLE_RATE = 16000
+
+
+def download_source(url: str, outdir: str = "uploads") -> str:
+    """Download the best audio stream as-is, without transcoding it"""
+    import yt_dlp  # deferred: slow to import and only needed for URLs
+
+    ydl_opts = {
+        'format': 'bestaudio/best',
+        'outtmpl': f'{outdir}/%(id)s.%(ext)s',
+        'nocheckcertificate': True
+    }
+
+    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        info = ydl.extract_info(url, download=True)
+        return ydl.prepare_filename(info)
+
+
+def ffmpeg_pcm_command(source: str, output: str = "-", start: float = 0.0) -> list:
+    """ffmpeg arguments decoding any container to 16 kHz mono float32, from start seconds"""
+    seek = ["-ss", f"{start:.3f}"] if start else []
+    return [
+        "ffmpeg", "-nostdin", "-threads", "0", "-loglevel", "error",
+        *seek, "-i", source,
+        "-f", "f32le", "-ac", "1", "-acodec", "pcm_f32le", "-ar", str(SAMPLE_RATE),
+        "-y", output,
+    ]
+
+
+def decode_to_pcm(source: str, pcm_path: str, start: float = 0.0) -> np.ndarray:
+    """Decode source once to a raw float32 file and memory-map it
+
+    Replaces the MP3 transcode plus whisper.load_audio round trip: the
+    container is decoded a single time and the samples are paged in from
+    disk on demand instead of being copied into process memory.
+    """
+    try:
+        subprocess.run(ffmpeg_pcm_command(source, pcm_path, start), capture_output=True, check=True)
+    except subprocess.CalledProcessError as e:
+        raise RuntimeError(f"Failed to decode audio: {e.stderr.decode().strip()}") from e
+
+    if os.path.getsize(pcm_path) == 0:
+        return np.zeros(0, dtype=np.float32)
+    return np.memmap(pcm_path, dtype=np.float32, mode="r")
+
+
+def stream_pcm(source: str, block_seconds: float = 30.0, start: float = 0.0):
+    """Yield 16 kHz mono float32 blocks from an ffmpeg pipe as they are decoded"""
+    block_bytes = int(block_seconds * SAMPLE_RATE) * 4
+    process = subprocess.Popen(ffmpeg_pcm_command(source, start=start), stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    try:
+        while True:
+            data = process.stdout.read(block_bytes)
+            if not data:
+                break
+            yield np.frombuffer(data, dtype=np.float32)
+        if process.wait() != 0:
+            raise RuntimeError(f"Failed to decode audio: {process.stderr.read().decode().strip()}")
+    finally:
+        if process.poll() is None:
+            process.kill()
+            process.wait()
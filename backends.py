@@ -0,0 +1,58 @@
+import torch
+import whisper
+from torch.ao.quantization import quantize_dynamic
+
+
+def _plain_linears(model):
+    """Swap whisper's Linear subclass for nn.Linear sharing the same weights
+
+    Dynamic quantization only converts modules whose type is exactly
+    nn.Linear; whisper's subclass only adds dtype casting, which is a
+    no-op for float32 inputs.
+    """
+    for parent in list(model.modules()):
+        for name, child in list(parent.named_children()):
+            if type(child) is whisper.model.Linear:
+                linear = torch.nn.Linear(child.in_features, child.out_features, bias=child.bias is not None)
+                linear.weight = child.weight
+                linear.bias = child.bias
+                setattr(parent, name, linear)
+    return model
+
+
+def _int8(model):
+    """Dynamic int8 quantization of every linear layer"""
+    return quantize_dynamic(_plain_linears(model), {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def _autocast(module, dtype: torch.dtype):
+    # Whisper checks that audio features come back as float32 when fp16 is
+    # off, so compute in reduced precision but return float32 outputs
+    forward = module.forward
+
+    def run(*args, **kwargs):
+        with torch.autocast("cpu", dtype=dtype):
+            return forward(*args, **kwargs).float()
+
+    module.forward = run
+
+
+def _bf16(model):
+    """Run the encoder and decoder under CPU bfloat16 autocast"""
+    _autocast(model.encoder, torch.bfloat16)
+    _autocast(model.decoder, torch.bfloat16)
+    return model
+
+
+# Inference backends by name: each takes a freshly loaded fp32 model
+BACKENDS = {
+    "fp32": lambda model: model,
+    "int8": _int8,
+    "bf16": _bf16,
+}
+
+
+def prepare(model, backend: str):
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend '{backend}', expected one of {', '.join(BACKENDS)}")
+    return BACKENDS[backend](model)
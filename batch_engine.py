@@ -0,0 +1,237 @@
+import time
+
+import numpy as np
+import torch
+import whisper
+from whisper.audio import N_FFT, HOP_LENGTH, N_SAMPLES, SAMPLE_RATE, mel_filters
+from whisper.timing import add_word_timestamps
+from whisper.tokenizer import get_tokenizer
+
+import metrics
+from model_registry import registry
+from worker_pool import Cancelled, cancel_flag
+
+# Each timestamp token step is 20 ms
+SECONDS_PER_TIMESTAMP = HOP_LENGTH * 2 / SAMPLE_RATE
+
+# whisper.transcribe's defaults: windows that look like a repetition loop or a low-confidence
+# guess are decoded again, sampling at each higher temperature in turn, unless they are silence
+TEMPERATURES = (0.0, 0.2, 0.4, 0.6, 0.8, 1.0)
+COMPRESSION_RATIO_THRESHOLD = 2.4
+LOGPROB_THRESHOLD = -1.0
+NO_SPEECH_THRESHOLD = 0.6
+
+
+def log_mel_batch(windows, n_mels: int) -> torch.Tensor:
+    """Log-mel spectrograms for several windows in one STFT pass
+
+    Matches whisper.log_mel_spectrogram, except that the dynamic range is
+    clamped per window instead of across the whole batch.
+    """
+    audio = torch.from_numpy(np.stack([whisper.pad_or_trim(np.asarray(w, dtype=np.float32)) for w in windows]))
+    stft = torch.stft(audio, N_FFT, HOP_LENGTH, window=torch.hann_window(N_FFT), return_complex=True)
+    magnitudes = stft[..., :-1].abs() ** 2
+    mel_spec = mel_filters(audio.device, n_mels) @ magnitudes
+    log_spec = torch.clamp(mel_spec, min=1e-10).log10()
+    peak = log_spec.amax(dim=(-2, -1), keepdim=True)
+    log_spec = torch.maximum(log_spec, peak - 8.0)
+    return (log_spec + 4.0) / 4.0
+
+
+def split_segments(tokenizer, tokens, duration: float) -> list:
+    """Turn a timestamped token sequence into {start, end, text, tokens} segments"""
+    segments = []
+    start = 0.0
+    text_tokens = []
+    for token in tokens:
+        if token >= tokenizer.timestamp_begin:
+            time = (token - tokenizer.timestamp_begin) * SECONDS_PER_TIMESTAMP
+            if text_tokens:
+                segments.append({"start": start, "end": time, "text": tokenizer.decode(text_tokens).strip(),
+                                 "tokens": text_tokens})
+                text_tokens = []
+            start = time
+        elif token < tokenizer.eot:
+            text_tokens.append(token)
+    if text_tokens:
+        # Window ended mid-segment without a closing timestamp
+        segments.append({"start": start, "end": duration, "text": tokenizer.decode(text_tokens).strip(),
+                         "tokens": text_tokens})
+    return [s for s in segments if s["text"]]
+
+
+def finish_segments(model, tokenizer, mel: torch.Tensor, segments: list, duration: float, word_timestamps: bool):
+    """Clip segments to the window and drop their tokens, first aligning words if asked
+
+    Word timings come from whisper's cross-attention alignment, which runs
+    the model over the window once more.
+    """
+    if word_timestamps and segments:
+        for segment in segments:
+            segment["seek"] = 0
+        with metrics.span("word_alignment"), torch.no_grad():
+            add_word_timestamps(segments=segments, model=model, tokenizer=tokenizer, mel=mel,
+                                num_frames=int(duration * SAMPLE_RATE) // HOP_LENGTH, last_speech_timestamp=0.0)
+    for segment in segments:
+        segment["end"] = min(segment["end"], duration)
+        del segment["tokens"]
+        segment.pop("seek", None)
+        if "words" in segment:
+            segment["words"] = [{"start": w["start"], "end": min(w["end"], duration), "word": w["word"]}
+                                for w in segment["words"]]
+    return segments
+
+
+def _check_cancelled(module, args):
+    flag = cancel_flag.get()
+    if flag is not None and flag.is_set():
+        raise Cancelled("Inference cancelled")
+
+
+def stop_when_cancelled(model):
+    """Make the encoder and every decoding step check the calling task's cancel flag
+
+    Raising from the hook abandons whisper.decode between tokens, so an
+    abandoned stream frees the model within one step instead of one batch.
+    """
+    if not getattr(model, "_cancel_hooks", False):
+        model.encoder.register_forward_pre_hook(_check_cancelled)
+        model.decoder.register_forward_pre_hook(_check_cancelled)
+        model._cancel_hooks = True
+
+
+def encode(model, mel: torch.Tensor) -> torch.Tensor:
+    """Run the audio encoder on its own so it can be timed; whisper.decode accepts the features"""
+    with metrics.span("encoder"), torch.no_grad():
+        return model.embed_audio(mel)
+
+
+def _is_silence(result) -> bool:
+    """whisper.transcribe's silence check: likely no speech and no confident text"""
+    return result.no_speech_prob > NO_SPEECH_THRESHOLD and result.avg_logprob < LOGPROB_THRESHOLD
+
+
+def _needs_fallback(result) -> bool:
+    if _is_silence(result):
+        return False
+    return result.compression_ratio > COMPRESSION_RATIO_THRESHOLD or result.avg_logprob < LOGPROB_THRESHOLD
+
+
+def decode(model, features: torch.Tensor, **options) -> list:
+    """whisper.decode with whisper.transcribe's temperature fallback
+
+    All windows are decoded greedily together; only those that fail the
+    checks are decoded again, as a smaller batch, at the next temperature.
+    """
+    results = [None] * len(features)
+    pending = list(range(len(features)))
+    for temperature in TEMPERATURES:
+        stage = "decoder" if temperature == 0 else "decoder_fallback"
+        with metrics.span(stage):
+            decoded = whisper.decode(model, features[pending],
+                                     whisper.DecodingOptions(temperature=temperature, fp16=False, **options))
+        if temperature > 0:
+            metrics.decode_fallbacks.inc(len(pending), temperature=temperature)
+        retry = []
+        for i, result in zip(pending, decoded):
+            results[i] = result
+            if _needs_fallback(result):
+                retry.append(i)
+        pending = retry
+        if not pending:
+            break
+    return results
+
+
+def transcribe_batch(model_name: str, windows, language: str = None, backend: str = None,
+                     word_timestamps: bool = False) -> list:
+    """Transcribe up to 30 s windows together; returns segments per window, relative to its start
+
+    With word_timestamps, each segment also has a list of {start, end, word}.
+    """
+    with registry.use(model_name, backend) as model:
+        stop_when_cancelled(model)
+        with metrics.span("mel"):
+            mel = log_mel_batch(windows, model.dims.n_mels).to(model.device)
+        features = encode(model, mel)
+        results = decode(model, features, language=language)
+        tokenizer = get_tokenizer(model.is_multilingual, num_languages=model.num_languages, task="transcribe")
+
+        batch = []
+        for i, (window, result) in enumerate(zip(windows, results)):
+            if _is_silence(result):
+                batch.append([])
+                continue
+            duration = min(len(window), N_SAMPLES) / SAMPLE_RATE
+            segments = split_segments(tokenizer, result.tokens, duration)
+            batch.append(finish_segments(model, tokenizer, mel[i], segments, duration, word_timestamps))
+    return batch
+
+
+def _complete_segments(tokenizer, tokens: list, duration: float):
+    """Tokens of a window's complete segments and the seconds of audio they cover
+
+    Follows whisper.transcribe: unless the window ends on a lone timestamp,
+    text after the last pair of consecutive timestamps is left for the next
+    window, which then starts where the last complete segment ended.
+    """
+    timestamps = [token >= tokenizer.timestamp_begin for token in tokens]
+    single_timestamp_ending = timestamps[-2:] == [False, True]
+    consecutive = [i + 1 for i in range(len(tokens) - 1) if timestamps[i] and timestamps[i + 1]]
+    if consecutive and not single_timestamp_ending:
+        cut = consecutive[-1]
+        seconds = (tokens[cut - 1] - tokenizer.timestamp_begin) * SECONDS_PER_TIMESTAMP
+        if seconds > 0:
+            return tokens[:cut], min(seconds, duration)
+    return tokens, duration
+
+
+def transcribe_window(model_name: str, window, language: str = None, prompt: list = None,
+                      backend: str = None, word_timestamps: bool = False) -> dict:
+    """Transcribe one window conditioned on the previous text, for long-form decoding
+
+    Returns the window's complete segments, the seconds they cover (where
+    the next window should start), the language (detected on first use)
+    and the prompt for the next window.
+    """
+    with registry.use(model_name, backend) as model:
+        stop_when_cancelled(model)
+        with metrics.span("mel"):
+            mel = log_mel_batch([window], model.dims.n_mels).to(model.device)
+        features = encode(model, mel)
+        if language is None and not model.is_multilingual:
+            language = "en"
+        result = decode(model, features, language=language, prompt=prompt or None)[0]
+        tokenizer = get_tokenizer(model.is_multilingual, num_languages=model.num_languages,
+                                  language=result.language, task="transcribe")
+
+        # whisper.decode only looks at the last n_text_ctx // 2 - 1 prompt tokens
+        prompt_tokens = model.dims.n_text_ctx // 2 - 1
+        duration = min(len(window), N_SAMPLES) / SAMPLE_RATE
+        if _is_silence(result):
+            return {"segments": [], "seconds": duration, "language": result.language,
+                    "prompt": list(prompt or [])[-prompt_tokens:]}
+
+        tokens, seconds = _complete_segments(tokenizer, result.tokens, duration)
+        segments = finish_segments(model, tokenizer, mel[0], split_segments(tokenizer, tokens, seconds), seconds,
+                                   word_timestamps)
+    # Like whisper.transcribe, text that needed a high temperature ends the prompt history
+    prompt = [] if result.temperature > 0.5 else (list(prompt or []) + tokens)[-prompt_tokens:]
+    return {"segments": segments, "seconds": seconds, "language": result.language, "prompt": prompt}
+
+
+def warm_up(model_name: str, backend: str = None, infer: bool = True) -> dict:
+    """Load a model and, with infer, run one second of silence through it
+
+    The first inference pays for lazy initialisation in torch and whisper
+    (kernels, tokenizer, mel filters), so doing it at startup keeps that
+    off the first request.
+    """
+    started = time.perf_counter()
+    registry.get(model_name, backend)
+    timings = {"load_seconds": round(time.perf_counter() - started, 3)}
+    if infer:
+        started = time.perf_counter()
+        transcribe_batch(model_name, [np.zeros(SAMPLE_RATE, dtype=np.float32)], backend=backend)
+        timings["warm_up_seconds"] = round(time.perf_counter() - started, 3)
+    return timings
@@ -0,0 +1,96 @@
+"""Compare inference backends for accuracy (WER) and speed (real-time factor)
+
+    python -m benchmarks.backends --audio sample.wav --reference sample.txt --models base small --backends fp32 int8 bf16
+
+WER is only reported when --reference points to a plain-text transcript of
+the audio; the synthetic fixture has none.
+"""
+import argparse
+import json
+import re
+import time
+
+from batch_engine import transcribe_batch
+from benchmarks.fixtures import load_fixture, SAMPLE_RATE
+from model_registry import registry
+
+CHUNK_SIZE = 30 * SAMPLE_RATE
+
+
+def words(text: str) -> list:
+    return re.sub(r"[^\w\s']", " ", text.lower()).split()
+
+
+def edit_counts(reference: str, hypothesis: str) -> dict:
+    """Substituted, inserted and deleted words in a minimal word-level alignment"""
+    ref, hyp = words(reference), words(hypothesis)
+    # Each cell holds (errors, substitutions, insertions, deletions)
+    previous = [(j, 0, j, 0) for j in range(len(hyp) + 1)]
+    for i, r in enumerate(ref, 1):
+        current = [(i, 0, 0, i)]
+        for j, h in enumerate(hyp, 1):
+            e, s, n, d = previous[j - 1]
+            match = (e + (r != h), s + (r != h), n, d)
+            e, s, n, d = current[j - 1]
+            insert = (e + 1, s, n + 1, d)
+            e, s, n, d = previous[j]
+            delete = (e + 1, s, n, d + 1)
+            current.append(min(match, insert, delete))
+        previous = current
+    errors, substitutions, insertions, deletions = previous[-1]
+    return {"errors": errors, "substitutions": substitutions, "insertions": insertions,
+            "deletions": deletions, "reference_words": len(ref)}
+
+
+def wer(reference: str, hypothesis: str) -> float:
+    """Word error rate: word-level edit distance over the reference length"""
+    counts = edit_counts(reference, hypothesis)
+    return counts["errors"] / max(1, counts["reference_words"])
+
+
+def transcribe(model_name: str, backend: str, audio, batch_size: int) -> str:
+    chunks = [audio[i:i + CHUNK_SIZE] for i in range(0, len(audio), CHUNK_SIZE)]
+    texts = []
+    for i in range(0, len(chunks), batch_size):
+        for segments in transcribe_batch(model_name, chunks[i:i + batch_size], backend=backend):
+            texts.extend(segment["text"] for segment in segments)
+    return " ".join(texts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--audio", help="Local audio file (default: synthetic fixture)")
+    parser.add_argument("--reference", help="Reference transcript of --audio, as plain text")
+    parser.add_argument("--seconds", type=float, default=120.0, help="Length of the synthetic fixture")
+    parser.add_argument("--models", nargs="+", default=["base"])
+    parser.add_argument("--backends", nargs="+", default=["fp32", "int8", "bf16"])
+    parser.add_argument("--batch-size", type=int, default=4)
+    args = parser.parse_args()
+
+    audio = load_fixture(args.audio, args.seconds)
+    duration = len(audio) / SAMPLE_RATE
+    reference = open(args.reference).read() if args.reference else None
+
+    runs = []
+    for model_name in args.models:
+        for backend in args.backends:
+            entry = registry.get(model_name, backend)
+            start = time.perf_counter()
+            text = transcribe(model_name, backend, audio, args.batch_size)
+            seconds = time.perf_counter() - start
+            runs.append({
+                "model": model_name,
+                "backend": backend,
+                "load_seconds": round(entry.load_seconds, 3),
+                "param_mb": round(entry.param_bytes / 2**20, 1),
+                "seconds": round(seconds, 3),
+                "rtf": round(seconds / duration, 4),
+                "wer": round(wer(reference, text), 4) if reference is not None else None,
+                "words": len(words(text)),
+            })
+
+    print(json.dumps({"audio_seconds": round(duration, 2), "runs": runs}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
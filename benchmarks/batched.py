@@ -0,0 +1,67 @@
+"""Compare the batched engine against the one-chunk-at-a-time loop
+
+    python -m benchmarks.batched --audio sample.wav --model base --batch-sizes 1 2 4 8
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+
+from batch_engine import transcribe_batch
+from benchmarks.fixtures import load_fixture, SAMPLE_RATE
+from model_registry import registry
+
+CHUNK_SIZE = 30 * SAMPLE_RATE
+
+
+def sequential_loop(model_name: str, audio: np.ndarray) -> int:
+    """The original process_audio loop: one padded model.transcribe per chunk"""
+    segments = 0
+    for i in range(0, len(audio), CHUNK_SIZE):
+        chunk = audio[i:i + CHUNK_SIZE]
+        if len(chunk) < CHUNK_SIZE:
+            chunk = np.pad(chunk, (0, CHUNK_SIZE - len(chunk)))
+        with registry.use(model_name) as model:
+            segments += len(model.transcribe(chunk, fp16=False)["segments"])
+    return segments
+
+
+def batched_loop(model_name: str, audio: np.ndarray, batch_size: int) -> int:
+    chunks = [audio[i:i + CHUNK_SIZE] for i in range(0, len(audio), CHUNK_SIZE)]
+    segments = 0
+    for i in range(0, len(chunks), batch_size):
+        segments += sum(len(s) for s in transcribe_batch(model_name, chunks[i:i + batch_size]))
+    return segments
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    segments = fn(*args)
+    return time.perf_counter() - start, segments
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--audio", help="Local audio file (default: synthetic fixture)")
+    parser.add_argument("--seconds", type=float, default=120.0, help="Length of the synthetic fixture")
+    parser.add_argument("--model", default="base")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 2, 4, 8])
+    args = parser.parse_args()
+
+    audio = load_fixture(args.audio, args.seconds)
+    duration = len(audio) / SAMPLE_RATE
+    registry.get(args.model)
+
+    runs = []
+    seconds, segments = timed(sequential_loop, args.model, audio)
+    runs.append({"mode": "sequential", "seconds": round(seconds, 3), "rtf": round(seconds / duration, 4), "segments": segments})
+    for batch_size in args.batch_sizes:
+        seconds, segments = timed(batched_loop, args.model, audio, batch_size)
+        runs.append({"mode": f"batched-{batch_size}", "seconds": round(seconds, 3), "rtf": round(seconds / duration, 4), "segments": segments})
+
+    print(json.dumps({"model": args.model, "audio_seconds": round(duration, 2), "runs": runs}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
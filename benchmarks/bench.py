@@ -0,0 +1,178 @@
+"""Benchmark the full transcription pipeline and report JSON for regression tracking
+
+    python -m benchmarks.bench --audio sample.wav --models tiny base --chunking vad fixed context --threads 1 4 --output bench.json
+
+Every model x chunking x thread combination runs in a fresh process, so
+load time and peak RSS are measured cold. Audio is a local file or a
+generated fixture; models must already be in the whisper cache, as
+nothing is downloaded.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import wave
+
+import numpy as np
+
+from benchmarks.fixtures import synthetic_audio, SAMPLE_RATE
+
+
+def write_wav(audio: np.ndarray, path: str):
+    with wave.open(path, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(SAMPLE_RATE)
+        f.writeframes((np.clip(audio, -1, 1) * 32767).astype(np.int16).tobytes())
+
+
+async def stream_events(process_audio, path: str, timing, model: str) -> dict:
+    """Run process_audio to completion, serializing each segment as the SSE endpoint does"""
+    from sse_starlette.sse import ServerSentEvent
+    from streaming import WireFormat
+
+    fmt = WireFormat()
+    started = time.perf_counter()
+    first_segment = None
+    sse_seconds = 0.0
+    segments = 0
+    async for event in process_audio(path, timing, model=model):
+        if event["type"] != "segment":
+            continue
+        segments += 1
+        serialize_start = time.perf_counter()
+        for event_id, payload in fmt.segments("bench", [(segments, event["data"])]):
+            ServerSentEvent(id=event_id, event="message", data=fmt.dumps(payload)).encode()
+        sse_seconds += time.perf_counter() - serialize_start
+        if first_segment is None:
+            first_segment = time.perf_counter() - started
+    return {
+        "end_to_end_seconds": time.perf_counter() - started,
+        "first_segment_seconds": first_segment,
+        "sse_seconds": sse_seconds,
+        "segments": segments,
+    }
+
+
+def run_one(audio_path: str, model: str) -> dict:
+    """One measured run, configured through the environment by the parent process"""
+    started = time.perf_counter()
+    import app
+    import config
+    from audio_io import stream_pcm
+    from model_registry import registry, peak_rss_bytes
+    from pipeline import StageStats, percentile
+    import_seconds = time.perf_counter() - started
+
+    entry = registry.get(model)
+
+    decode_start = time.perf_counter()
+    samples = sum(len(block) for block in stream_pcm(audio_path, config.DECODE_BLOCK_SECONDS))
+    decode_seconds = time.perf_counter() - decode_start
+    duration = samples / SAMPLE_RATE
+
+    timing = StageStats("inference")
+    result = asyncio.run(stream_events(app.process_audio, audio_path, timing, model))
+    latencies = list(timing.latencies)
+
+    return {
+        "audio_seconds": round(duration, 2),
+        "import_seconds": round(import_seconds, 3),
+        "load_seconds": round(entry.load_seconds, 3),
+        "decode_seconds": round(decode_seconds, 3),
+        "inference_seconds": round(timing.busy_seconds, 3),
+        "sse_seconds": round(result["sse_seconds"], 4),
+        "end_to_end_seconds": round(result["end_to_end_seconds"], 3),
+        "rtf": round(result["end_to_end_seconds"] / duration, 4) if duration else None,
+        "first_segment_seconds": round(result["first_segment_seconds"], 3)
+        if result["first_segment_seconds"] is not None else None,
+        "chunks": len(latencies),
+        "chunk_p50_seconds": round(percentile(latencies, 50), 3),
+        "chunk_p95_seconds": round(percentile(latencies, 95), 3),
+        "chunk_cost_seconds": round(timing.busy_seconds / timing.items, 4) if timing.items else None,
+        "segments": result["segments"],
+        "peak_rss_mb": round(peak_rss_bytes() / 2**20, 1),
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--audio", help="Local audio file (default: synthetic fixture)")
+    parser.add_argument("--seconds", type=float, default=120.0, help="Length of the synthetic fixture")
+    parser.add_argument("--models", nargs="+", default=["base"])
+    parser.add_argument("--chunking", nargs="+", default=["vad", "fixed", "context"])
+    parser.add_argument("--threads", type=int, nargs="+", default=[os.cpu_count() or 1])
+    parser.add_argument("--backend", default="fp32")
+    parser.add_argument("--output", help="Also write the report to this file")
+    parser.add_argument("--run-one", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--result", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_one:
+        with open(args.result, "w") as f:
+            json.dump(run_one(args.audio, args.models[0]), f)
+        return
+
+    with tempfile.TemporaryDirectory() as workdir:
+        audio_path = args.audio
+        if audio_path is None:
+            audio_path = os.path.join(workdir, "fixture.wav")
+            write_wav(synthetic_audio(args.seconds), audio_path)
+
+        runs = []
+        for model in args.models:
+            for chunking in args.chunking:
+                for threads in args.threads:
+                    result_path = os.path.join(workdir, "result.json")
+                    env = dict(
+                        os.environ,
+                        WHISPER_MODELS=model,
+                        WHISPER_DEFAULT_MODEL=model,
+                        WHISPER_BACKEND=args.backend,
+                        CHUNKING=chunking,
+                        TORCH_THREADS=str(threads),
+                        SHARD_WORKERS="0",
+                        TRANSCRIPT_CACHE="0",
+                        JOB_STORE_PATH=os.path.join(workdir, "jobs.db"),
+                    )
+                    command = [sys.executable, "-m", "benchmarks.bench", "--run-one", "--audio", audio_path,
+                               "--models", model, "--result", result_path]
+                    run = {"model": model, "backend": args.backend, "chunking": chunking, "threads": threads}
+                    completed = subprocess.run(command, env=env, capture_output=True, text=True)
+                    if completed.returncode == 0:
+                        with open(result_path) as f:
+                            run.update(json.load(f))
+                    else:
+                        run["error"] = (completed.stderr.strip().splitlines() or ["failed"])[-1]
+                    print(f"{model} {chunking} x{threads}: {run.get('rtf', run.get('error'))}", file=sys.stderr)
+                    runs.append(run)
+
+    report = {
+        "revision": git_revision(),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "cores": os.cpu_count(),
+        "audio": args.audio or f"synthetic:{args.seconds:g}s",
+        "runs": runs,
+    }
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
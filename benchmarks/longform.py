@@ -0,0 +1,110 @@
+"""Compare independent chunks with long-form decoding in context
+
+    python -m benchmarks.longform --audio sample.wav --reference sample.txt --model base --chunking vad fixed
+
+"chunks" is the default loop: planned chunks are transcribed cold in
+batches and stitched. "context" detects the language once, prompts each
+window with the previous text and seeks by segment end times. Repeated
+words at window seams are counted for both; with --reference, inserted
+and deleted words show duplicated and missing text overall.
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from batch_engine import transcribe_batch
+from benchmarks.backends import edit_counts, words
+from benchmarks.fixtures import load_fixture, SAMPLE_RATE
+from model_registry import registry
+from segmenter import SeamStitcher
+from sharded import plan_ranges
+
+
+def chunked(model_name: str, audio, chunking: str, batch_size: int) -> list:
+    """(window index, segment) pairs from independent chunks"""
+    ranges = plan_ranges(audio, chunking)
+    stitcher = SeamStitcher()
+    segments = []
+    for i in range(0, len(ranges), batch_size):
+        batch = ranges[i:i + batch_size]
+        results = transcribe_batch(model_name, [audio[start:end] for start, end in batch])
+        for n, ((start, _), window) in enumerate(zip(batch, results), i):
+            for segment in window:
+                segment["start"] += start / SAMPLE_RATE
+                segment["end"] += start / SAMPLE_RATE
+            segments.extend((n, segment) for segment in stitcher.feed(window))
+    return segments
+
+
+def in_context(model_name: str, audio) -> list:
+    """(window index, segment) pairs from the app's long-form decoding loop"""
+    import app
+
+    async def run():
+        segments = []
+        n = 0
+        # Each window's segments are followed by a progress event
+        async for event in app.transcribe_in_context(iter([audio]), None, 0.0, model_name, None):
+            if event["type"] == "progress":
+                n += 1
+            else:
+                segments.append((n, event["data"]))
+        return segments
+
+    return asyncio.run(run())
+
+
+def seam_repeats(segments: list) -> int:
+    """Words repeated across window seams: the end of one window's text starting the next"""
+    repeated = 0
+    for (a, before), (b, after) in zip(segments, segments[1:]):
+        if a == b:
+            continue
+        tail, head = words(before["text"]), words(after["text"])
+        repeated += max((k for k in range(1, min(len(tail), len(head)) + 1) if tail[-k:] == head[:k]), default=0)
+    return repeated
+
+
+def measure(mode: str, fn, args, duration: float, reference: str) -> dict:
+    start = time.perf_counter()
+    segments = fn(*args)
+    seconds = time.perf_counter() - start
+    text = " ".join(segment["text"] for _, segment in segments)
+    run = {
+        "mode": mode,
+        "seconds": round(seconds, 3),
+        "rtf": round(seconds / duration, 4),
+        "windows": len({n for n, _ in segments}),
+        "segments": len(segments),
+        "words": len(words(text)),
+        "seam_repeated_words": seam_repeats(segments),
+    }
+    if reference is not None:
+        run.update(edit_counts(reference, text))
+    return run
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--audio", help="Local audio file (default: synthetic fixture)")
+    parser.add_argument("--reference", help="Reference transcript of --audio, as plain text")
+    parser.add_argument("--seconds", type=float, default=120.0, help="Length of the synthetic fixture")
+    parser.add_argument("--model", default="base")
+    parser.add_argument("--chunking", nargs="+", default=["vad", "fixed"])
+    parser.add_argument("--batch-size", type=int, default=4)
+    args = parser.parse_args()
+
+    audio = load_fixture(args.audio, args.seconds)
+    duration = len(audio) / SAMPLE_RATE
+    reference = open(args.reference).read() if args.reference else None
+    registry.get(args.model)
+
+    runs = [measure(f"chunks-{chunking}", chunked, (args.model, audio, chunking, args.batch_size), duration, reference)
+            for chunking in args.chunking]
+    runs.append(measure("context", in_context, (args.model, audio), duration, reference))
+    print(json.dumps({"model": args.model, "audio_seconds": round(duration, 2), "runs": runs}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""Sweep worker-process x intra-op thread counts for sharded transcription
+
+    python -m benchmarks.shard_sweep --audio sample.wav --model base --workers 1 2 4 --threads 1 2 4
+
+Combinations using more threads in total than there are cores are skipped.
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+
+from benchmarks.fixtures import load_fixture, SAMPLE_RATE
+from sharded import ShardPool, plan_ranges
+
+
+async def run_sharded(pool: ShardPool, model_name: str, pcm_path: str, ranges: list, batch_size: int):
+    """Seconds to the first and the last merged batch"""
+    start = time.perf_counter()
+    first = None
+    segments = 0
+    async for _, results in pool.transcribe(model_name, pcm_path, ranges, batch_size):
+        if first is None:
+            first = time.perf_counter() - start
+        segments += sum(len(s) for s in results)
+    return first, time.perf_counter() - start, segments
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--audio", help="Local audio file (default: synthetic fixture)")
+    parser.add_argument("--seconds", type=float, default=300.0, help="Length of the synthetic fixture")
+    parser.add_argument("--model", default="base")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--batch-size", type=int, default=4)
+    args = parser.parse_args()
+
+    audio = load_fixture(args.audio, args.seconds)
+    duration = len(audio) / SAMPLE_RATE
+    cores = os.cpu_count() or 1
+
+    with tempfile.NamedTemporaryFile(suffix=".pcm") as pcm:
+        audio.tofile(pcm.name)
+        ranges = plan_ranges(audio)
+
+        runs = []
+        for workers in args.workers:
+            for threads in args.threads:
+                if workers * threads > cores:
+                    continue
+                pool = ShardPool(workers, threads)
+                try:
+                    # Load the model in every worker before timing
+                    warm_up = [ranges[0]] * workers
+                    asyncio.run(run_sharded(pool, args.model, pcm.name, warm_up, 1))
+                    first, seconds, segments = asyncio.run(
+                        run_sharded(pool, args.model, pcm.name, ranges, args.batch_size))
+                finally:
+                    pool.shutdown()
+                runs.append({
+                    "workers": workers,
+                    "threads": threads,
+                    "seconds": round(seconds, 3),
+                    "first_batch_seconds": round(first, 3),
+                    "rtf": round(seconds / duration, 4),
+                    "segments": segments,
+                })
+
+    best = min(runs, key=lambda run: run["seconds"]) if runs else None
+    print(json.dumps({"model": args.model, "audio_seconds": round(duration, 2), "cores": cores,
+                      "chunks": len(ranges), "best": best, "runs": runs}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""Measure cold start: app import, time to ready, model warm-up and first-request latency
+
+    python -m benchmarks.startup --models base --repeat 3 --output startup.json
+
+Each run is a fresh process, with and without a memory-mapped model
+snapshot and with and without the warm-up inference. The snapshot is
+written once before the timed runs. Models must already be in the
+whisper cache, as nothing is downloaded.
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+
+async def first_segment(app, path: str, model: str) -> float:
+    started = time.perf_counter()
+    async for event in app.process_audio(path, model=model):
+        if event["type"] == "segment":
+            break
+    return time.perf_counter() - started
+
+
+def run_one(audio_path: str, model: str) -> dict:
+    """One cold start, configured through the environment by the parent process"""
+    started = time.perf_counter()
+    import app
+    from model_registry import peak_rss_bytes
+    import_seconds = time.perf_counter() - started
+
+    async def start():
+        await app.start_up()
+        ready = time.perf_counter() - started
+        await app.warm_up_task
+        warm = time.perf_counter() - started
+        return ready, warm, await first_segment(app, audio_path, model)
+
+    ready_seconds, warm_seconds, first_request_seconds = asyncio.run(start())
+    return {
+        "import_seconds": round(import_seconds, 3),
+        "ready_seconds": round(ready_seconds, 3),
+        "warm_seconds": round(warm_seconds, 3),
+        "first_request_seconds": round(first_request_seconds, 3),
+        "models": app.startup["models"],
+        "peak_rss_mb": round(peak_rss_bytes() / 2**20, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--audio", help="Local audio file (default: synthetic fixture)")
+    parser.add_argument("--models", nargs="+", default=["base"])
+    parser.add_argument("--repeat", type=int, default=1, help="Runs per configuration")
+    parser.add_argument("--output", help="Also write the report to this file")
+    parser.add_argument("--run-one", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--result", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_one:
+        with open(args.result, "w") as f:
+            json.dump(run_one(args.audio, args.models[0]), f)
+        return
+
+    from benchmarks.bench import git_revision, write_wav
+    from benchmarks.fixtures import synthetic_audio
+
+    with tempfile.TemporaryDirectory() as workdir:
+        audio_path = args.audio
+        if audio_path is None:
+            audio_path = os.path.join(workdir, "fixture.wav")
+            write_wav(synthetic_audio(30.0), audio_path)
+        snapshot_dir = os.path.join(workdir, "snapshots")
+
+        runs = []
+        for model in args.models:
+            # Untimed: writes the snapshot the snapshot runs map
+            configurations = [("prime", snapshot_dir, True)]
+            configurations += [(None, directory, warm) for directory in ("", snapshot_dir) for warm in (False, True)
+                               for _ in range(args.repeat)]
+            for label, directory, warm in configurations:
+                result_path = os.path.join(workdir, "result.json")
+                env = dict(
+                    os.environ,
+                    WHISPER_MODELS=model,
+                    WHISPER_DEFAULT_MODEL=model,
+                    MODEL_SNAPSHOT_DIR=directory,
+                    WARMUP="1" if warm else "0",
+                    SHARD_WORKERS="0",
+                    TRANSCRIPT_CACHE="0",
+                    JOB_STORE_PATH=os.path.join(workdir, "jobs.db"),
+                )
+                command = [sys.executable, "-m", "benchmarks.startup", "--run-one", "--audio", audio_path,
+                           "--models", model, "--result", result_path]
+                completed = subprocess.run(command, env=env, capture_output=True, text=True)
+                if label == "prime":
+                    continue
+                run = {"model": model, "snapshot": bool(directory), "warm_up": warm}
+                if completed.returncode == 0:
+                    with open(result_path) as f:
+                        run.update(json.load(f))
+                else:
+                    run["error"] = (completed.stderr.strip().splitlines() or ["failed"])[-1]
+                print(f"{model} snapshot={run['snapshot']} warm_up={warm}: "
+                      f"{run.get('first_request_seconds', run.get('error'))}", file=sys.stderr)
+                runs.append(run)
+
+    report = {
+        "revision": git_revision(),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "cores": os.cpu_count(),
+        "audio": args.audio or "synthetic:30s",
+        "runs": runs,
+    }
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+import os
+from dotenv import load_dotenv
+
+load_dotenv()  # Load environment variables from .env file
+
+
+def _list(name: str, default: str) -> list:
+    return [item.strip() for item in os.getenv(name, default).split(",") if item.strip()]
+
+
+# Whisper model sizes loaded at startup, e.g. "base,small"
+WHISPER_MODELS = _list("WHISPER_MODELS", "base")
+DEFAULT_MODEL = os.getenv("WHISPER_DEFAULT_MODEL", WHISPER_MODELS[0] if WHISPER_MODELS else "base")
+
+# Inference backend when a request does not pick one: "fp32", "int8" (dynamic
+# quantization of linear layers) or "bf16" (CPU bfloat16 autocast)
+BACKEND = os.getenv("WHISPER_BACKEND", "fp32")
+
+# Maximum number of models kept in memory at once (least recently used is evicted)
+MAX_RESIDENT_MODELS = int(os.getenv("WHISPER_MAX_MODELS", "2"))
+
+# Inference worker pool: "thread" or "process"
+WORKER_POOL_KIND = os.getenv("WORKER_POOL_KIND", "thread")
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", "1"))
+IO_WORKERS = int(os.getenv("IO_WORKERS", "4"))
+
+# Jobs allowed to wait for a free worker before new requests are rejected as busy
+MAX_QUEUED_JOBS = int(os.getenv("MAX_QUEUED_JOBS", "4"))
+
+# Number of 30-second windows encoded and decoded together
+BATCH_SIZE = int(os.getenv("WHISPER_BATCH_SIZE", "4"))
+
+# Longest a queued window waits for windows from other jobs to share its batch
+BATCH_MAX_WAIT_MS = float(os.getenv("BATCH_MAX_WAIT_MS", "50"))
+
+# Chunking strategy: "vad" cuts in pauses and skips silence, "fixed" uses plain 30 s slices,
+# "context" decodes continuously with the previous text as prompt, like whisper.transcribe
+CHUNKING = os.getenv("CHUNKING", "vad")
+VAD_OVERLAP = float(os.getenv("VAD_OVERLAP", "0.5"))
+VAD_MIN_SILENCE = float(os.getenv("VAD_MIN_SILENCE", "0.5"))
+
+# On-disk transcript cache (SQLite), evicted least-recently-used beyond the size limit
+TRANSCRIPT_CACHE = os.getenv("TRANSCRIPT_CACHE", "1") == "1"
+TRANSCRIPT_CACHE_PATH = os.getenv("TRANSCRIPT_CACHE_PATH", "cache/transcripts.db")
+TRANSCRIPT_CACHE_MAX_MB = float(os.getenv("TRANSCRIPT_CACHE_MAX_MB", "256"))
+
+# Compact streams send the segments that arrive within this many milliseconds as one event
+STREAM_COALESCE_MS = float(os.getenv("STREAM_COALESCE_MS", "250"))
+
+# Segments a job may produce ahead of a slow client before its inference waits
+STREAM_QUEUE_SIZE = int(os.getenv("STREAM_QUEUE_SIZE", "16"))
+
+# Word-level timestamps by default (requests can also ask with ?words=1); costs an extra alignment pass
+WORD_TIMESTAMPS = os.getenv("WORD_TIMESTAMPS", "0") == "1"
+
+# Finished transcripts kept in memory, as columns, for exports
+TRANSCRIPT_STORE_SIZE = int(os.getenv("TRANSCRIPT_STORE_SIZE", "32"))
+
+# Write a cProfile dump of each job's pool work here (empty disables profiling)
+PROFILE_DIR = os.getenv("PROFILE_DIR", "")
+
+# Seconds of audio read from the ffmpeg pipe at a time
+DECODE_BLOCK_SECONDS = float(os.getenv("DECODE_BLOCK_SECONDS", "10"))
+
+# Largest accepted upload
+MAX_UPLOAD_MB = float(os.getenv("MAX_UPLOAD_MB", "2048"))
+
+# Uploads and per-job downloads live here, one workspace directory per job; beyond the
+# quota, workspaces not in use are deleted least-recently-used first
+STORAGE_DIR = os.getenv("STORAGE_DIR", "uploads")
+STORAGE_QUOTA_MB = float(os.getenv("STORAGE_QUOTA_MB", "10240"))
+
+# RAM-backed directory (e.g. /dev/shm/blayze) for PCM decoded for the length of a job;
+# empty keeps it in the job's workspace
+SCRATCH_DIR = os.getenv("SCRATCH_DIR", "")
+
+# SQLite file holding transcription jobs and their checkpointed segments
+JOB_STORE_PATH = os.getenv("JOB_STORE_PATH", "cache/jobs.db")
+
+# Intra-op threads for in-process inference
+TORCH_THREADS = int(os.getenv("TORCH_THREADS", "4"))
+
+# Sharded mode: split one recording across this many worker processes (0 disables)
+SHARD_WORKERS = int(os.getenv("SHARD_WORKERS", "0"))
+SHARD_THREADS = int(os.getenv("SHARD_THREADS", "4"))
+
+# Keep models as memory-mapped snapshots here, written on first load, so worker
+# processes share one copy of the weights (empty loads the whisper checkpoint as before)
+MODEL_SNAPSHOT_DIR = os.getenv("MODEL_SNAPSHOT_DIR", "")
+
+# Configured models load in the background once the server is up; with WARMUP each
+# also runs a short dummy inference, so the first request does not pay for it
+WARMUP = os.getenv("WARMUP", "1") == "1"
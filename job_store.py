@@ -0,0 +1,143 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+import config
+
+
+def _words(segment: dict):
+    return json.dumps(segment["words"]) if segment.get("words") else None
+
+
+def _segment(row) -> dict:
+    segment = {"start": row["start"], "end": row["end"], "text": row["text"]}
+    if row["words"]:
+        segment["words"] = json.loads(row["words"])
+    return segment
+
+
+class JobStore:
+    """Transcription jobs and their checkpointed segments, in SQLite
+
+    A job records how far into the audio it has got (next_offset, in
+    seconds) and the segments of every chunk before that point, so an
+    interrupted job can replay what it has and carry on from there.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._db is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.row_factory = sqlite3.Row
+            self._db.executescript(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id TEXT PRIMARY KEY, kind TEXT NOT NULL, source TEXT NOT NULL, model TEXT NOT NULL, "
+                "options TEXT NOT NULL, status TEXT NOT NULL, next_offset REAL NOT NULL DEFAULT 0, "
+                "error TEXT, created REAL NOT NULL, updated REAL NOT NULL);"
+                "CREATE TABLE IF NOT EXISTS segments ("
+                "job_id TEXT NOT NULL, seq INTEGER NOT NULL, start REAL NOT NULL, end REAL NOT NULL, "
+                "text TEXT NOT NULL, words TEXT, PRIMARY KEY (job_id, seq));"
+            )
+            # Stores created before word timestamps lack the column
+            columns = [row["name"] for row in self._db.execute("PRAGMA table_info(segments)")]
+            if "words" not in columns:
+                self._db.execute("ALTER TABLE segments ADD COLUMN words TEXT")
+        return self._db
+
+    def create(self, kind: str, source: str, model: str, options: dict) -> str:
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            db = self._connect()
+            db.execute(
+                "INSERT INTO jobs (id, kind, source, model, options, status, created, updated) "
+                "VALUES (?, ?, ?, ?, ?, 'running', ?, ?)",
+                (job_id, kind, source, model, json.dumps(options), now, now),
+            )
+            db.commit()
+        return job_id
+
+    def get(self, job_id: str):
+        with self._lock:
+            row = self._connect().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job["options"] = json.loads(job["options"])
+        return job
+
+    def segments(self, job_id: str, after_seq: int = 0) -> list:
+        """(seq, segment) pairs stored for a job, in order"""
+        with self._lock:
+            rows = self._connect().execute(
+                "SELECT seq, start, end, text, words FROM segments WHERE job_id = ? AND seq > ? ORDER BY seq",
+                (job_id, after_seq),
+            ).fetchall()
+        return [(row["seq"], _segment(row)) for row in rows]
+
+    def last_seq(self, job_id: str) -> int:
+        with self._lock:
+            return self._connect().execute(
+                "SELECT COALESCE(MAX(seq), 0) FROM segments WHERE job_id = ?", (job_id,)
+            ).fetchone()[0]
+
+    def checkpoint(self, job_id: str, segments: list, next_offset: float):
+        """Store a finished chunk's (seq, segment) pairs and advance the job's offset"""
+        with self._lock:
+            db = self._connect()
+            db.executemany(
+                "INSERT OR REPLACE INTO segments (job_id, seq, start, end, text, words) VALUES (?, ?, ?, ?, ?, ?)",
+                [(job_id, seq, s["start"], s["end"], s["text"], _words(s)) for seq, s in segments],
+            )
+            db.execute(
+                "UPDATE jobs SET next_offset = MAX(next_offset, ?), updated = ? WHERE id = ?",
+                (next_offset, time.time(), job_id),
+            )
+            db.commit()
+
+    def store_transcript(self, job_id: str, segments: list):
+        """Replace a job's segments with a complete transcript"""
+        with self._lock:
+            db = self._connect()
+            db.execute("DELETE FROM segments WHERE job_id = ?", (job_id,))
+            db.executemany(
+                "INSERT INTO segments (job_id, seq, start, end, text, words) VALUES (?, ?, ?, ?, ?, ?)",
+                [(job_id, seq, s["start"], s["end"], s["text"], _words(s)) for seq, s in enumerate(segments, 1)],
+            )
+            db.execute("UPDATE jobs SET status = 'complete', updated = ? WHERE id = ?", (time.time(), job_id))
+            db.commit()
+
+    def set_status(self, job_id: str, status: str, error: str = None):
+        with self._lock:
+            db = self._connect()
+            db.execute(
+                "UPDATE jobs SET status = ?, error = ?, updated = ? WHERE id = ?",
+                (status, error, time.time(), job_id),
+            )
+            db.commit()
+
+    def mark_interrupted(self) -> int:
+        """Flag jobs left running by a previous server process as resumable"""
+        with self._lock:
+            db = self._connect()
+            count = db.execute(
+                "UPDATE jobs SET status = 'interrupted', updated = ? WHERE status = 'running'", (time.time(),)
+            ).rowcount
+            db.commit()
+        return count
+
+    def status(self) -> dict:
+        with self._lock:
+            rows = self._connect().execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return {row[0]: row[1] for row in rows}
+
+
+job_store = JobStore(config.JOB_STORE_PATH)
@@ -0,0 +1,192 @@
+import contextvars
+import cProfile
+import os
+import pstats
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import config
+
+# Job (or comma-separated jobs, for shared batches) the current work is for.
+# Copied into thread pool tasks, so spans in workers carry it too.
+current_job = contextvars.ContextVar("current_job", default=None)
+
+# Recent spans as {job, stage, start, seconds}, for GET /jobs/{id}/spans
+recent_spans = deque(maxlen=5000)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+def _labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{str(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = tuple(labels.get(name, "") for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> list:
+        with self._lock:
+            values = dict(self._values)
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"] + [
+            f"{self.name}{_labels(self.labels, key)} {value:g}" for key, value in sorted(values.items())
+        ]
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labels: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self._series = {}  # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(labels.get(name, "") for name in self.labels)
+        with self._lock:
+            series = self._series.setdefault(key, [0] * len(self.buckets) + [0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> list:
+        with self._lock:
+            series = {key: list(values) for key, values in self._series.items()}
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, values in sorted(series.items()):
+            for bound, count in zip(self.buckets, values):
+                le = 'le="%g"' % bound
+                lines.append(f"{self.name}_bucket{_labels(self.labels, key, le)} {count}")
+            le = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_labels(self.labels, key, le)} {values[-1]}")
+            lines.append(f"{self.name}_sum{_labels(self.labels, key)} {values[-2]:.6f}")
+            lines.append(f"{self.name}_count{_labels(self.labels, key)} {values[-1]}")
+        return lines
+
+
+class Gauge:
+    """A value read at scrape time: fn returns a number, or {label value: number}
+
+    kind="counter" exposes a running total kept elsewhere, e.g. cache hits.
+    """
+
+    def __init__(self, name: str, help: str, fn, label: str = None, kind: str = "gauge"):
+        self.name = name
+        self.help = help
+        self.fn = fn
+        self.label = label
+        self.kind = kind
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        value = self.fn()
+        if isinstance(value, dict):
+            lines += [f'{self.name}{{{self.label}="{key}"}} {v:g}' for key, v in sorted(value.items())]
+        else:
+            lines.append(f"{self.name} {value:g}")
+        return lines
+
+
+stage_seconds = Histogram("blayze_stage_seconds", "Time spent in each pipeline stage", ("stage",))
+audio_seconds = Counter("blayze_audio_seconds_total", "Seconds of audio transcribed")
+segments_emitted = Counter("blayze_segments_emitted_total", "Transcript segments sent to clients")
+decode_fallbacks = Counter("blayze_decode_fallbacks_total", "Windows decoded again at a higher temperature",
+                           ("temperature",))
+jobs_finished = Counter("blayze_jobs_finished_total", "Transcription streams ended, by outcome", ("outcome",))
+_gauges = []
+
+
+def gauge(name: str, help: str, fn, label: str = None, kind: str = "gauge"):
+    """Register a value that is read when /metrics is scraped"""
+    _gauges.append(Gauge(name, help, fn, label, kind))
+
+
+def record_span(stage: str, seconds: float, job: str = None, start: float = None):
+    job = job if job is not None else current_job.get()
+    stage_seconds.observe(seconds, stage=stage)
+    recent_spans.append({
+        "job": job,
+        "stage": stage,
+        "start": round(start if start is not None else time.time() - seconds, 3),
+        "seconds": round(seconds, 6),
+    })
+
+
+@contextmanager
+def span(stage: str, job: str = None):
+    """Time a block of work as one stage of the current job"""
+    start = time.time()
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_span(stage, time.perf_counter() - started, job, start)
+
+
+def job_spans(job_id: str) -> list:
+    return [s for s in list(recent_spans) if s["job"] and job_id in s["job"].split(",")]
+
+
+# Per-job profiles of pool work, when PROFILE_DIR is set
+_profiles = {}
+_profiles_lock = threading.Lock()
+
+
+def profile_call(fn, args, kwargs):
+    """Run fn, profiling it for the current job(s) if profiling is on"""
+    job = current_job.get()
+    if not config.PROFILE_DIR or not job:
+        return fn(*args, **kwargs)
+    profile = cProfile.Profile()
+    try:
+        profile.enable()
+    except ValueError:
+        # Python 3.12+ allows one active profiler per interpreter, so overlapping tasks run unprofiled
+        return fn(*args, **kwargs)
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        profile.disable()
+        with _profiles_lock:
+            for job_id in job.split(","):
+                _profiles.setdefault(job_id, []).append(profile)
+
+
+def dump_profile(job_id: str):
+    """Write a job's merged profile to PROFILE_DIR/<job>.prof, if one was taken"""
+    with _profiles_lock:
+        profiles = _profiles.pop(job_id, None)
+    if not profiles:
+        return None
+    os.makedirs(config.PROFILE_DIR, exist_ok=True)
+    path = os.path.join(config.PROFILE_DIR, f"{job_id}.prof")
+    stats = pstats.Stats(profiles[0])
+    for profile in profiles[1:]:
+        stats.add(profile)
+    stats.dump_stats(path)
+    print(f"Profile for job {job_id} written to {path}")
+    return path
+
+
+def render() -> str:
+    lines = []
+    for metric in (stage_seconds, audio_seconds, segments_emitted, decode_fallbacks, jobs_finished, *_gauges):
+        lines += metric.render()
+    return "\n".join(lines) + "\n"
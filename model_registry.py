@@ -0,0 +1,232 @@
+import os
+import threading
+import time
+import resource
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import config
+import metrics
+
+# torch, whisper and backends (which needs torch) are imported on first use,
+# so importing the app stays fast and the server can start before they load
+
+
+def rss_bytes() -> int:
+    """Current resident set size of this process"""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * resource.getpagesize()
+    except (OSError, ValueError, IndexError):
+        # ru_maxrss is the peak, in KB on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def peak_rss_bytes() -> int:
+    """Peak resident set size of this process"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def model_bytes(model) -> int:
+    """Bytes held by a model's weights, including packed quantized ones"""
+    import torch
+
+    def size(value):
+        if isinstance(value, torch.Tensor):
+            return value.numel() * value.element_size()
+        if isinstance(value, (tuple, list)):
+            return sum(size(v) for v in value)
+        return 0
+    return sum(size(value) for value in model.state_dict().values())
+
+
+def resolve_model(name: str = None, backend: str = None) -> tuple:
+    """(model, backend) for a request, falling back to the server defaults
+
+    Only the configured models are served: any other name would make the
+    inference worker download and load it, evicting the preloaded ones.
+    """
+    import backends
+
+    name = name or config.DEFAULT_MODEL
+    backend = backend or config.BACKEND
+    allowed = dict.fromkeys(config.WHISPER_MODELS + [config.DEFAULT_MODEL])
+    if name not in allowed:
+        raise ValueError(f"Unknown model '{name}', expected one of {', '.join(allowed)}")
+    if backend not in backends.BACKENDS:
+        raise ValueError(f"Unknown backend '{backend}', expected one of {', '.join(backends.BACKENDS)}")
+    return name, backend
+
+
+def snapshot_path(name: str) -> str:
+    return os.path.join(config.MODEL_SNAPSHOT_DIR, f"{os.path.basename(name)}.pt")
+
+
+def write_snapshot(model, path: str):
+    """Save a model's float32 weights, plus the buffers whisper leaves out of its state dict"""
+    import torch
+
+    state = model.state_dict()
+    extra = {name: buffer for name, buffer in model.named_buffers() if name not in state}
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    partial = f"{path}.{os.getpid()}.tmp"
+    torch.save({
+        "dims": vars(model.dims),
+        "state": state,
+        "buffers": {name: b.to_dense() if b.is_sparse else b for name, b in extra.items()},
+        "sparse": [name for name, b in extra.items() if b.is_sparse],
+    }, partial)
+    os.replace(partial, path)
+
+
+def load_snapshot(path: str):
+    """Build a model around memory-mapped weights
+
+    The modules are created on the meta device, so no weights are allocated
+    or initialised, and the mapped tensors are then assigned in place.
+    Processes mapping the same file share its pages.
+    """
+    import torch
+    from torch import nn
+    from whisper.model import AudioEncoder, ModelDimensions, TextDecoder, Whisper
+
+    snapshot = torch.load(path, mmap=True, weights_only=True)
+    dims = ModelDimensions(**snapshot["dims"])
+    # Whisper.__init__ builds its alignment heads with an op meta tensors lack, so assemble it here
+    model = Whisper.__new__(Whisper)
+    nn.Module.__init__(model)
+    model.dims = dims
+    with torch.device("meta"):
+        model.encoder = AudioEncoder(dims.n_mels, dims.n_audio_ctx, dims.n_audio_state, dims.n_audio_head,
+                                     dims.n_audio_layer)
+        model.decoder = TextDecoder(dims.n_vocab, dims.n_text_ctx, dims.n_text_state, dims.n_text_head,
+                                    dims.n_text_layer)
+    model.load_state_dict(snapshot["state"], assign=True)
+    for name, buffer in snapshot["buffers"].items():
+        module, _, leaf = name.rpartition(".")
+        buffer = buffer.to_sparse() if name in snapshot["sparse"] else buffer
+        model.get_submodule(module).register_buffer(leaf, buffer, persistent=False)
+    return model.eval()
+
+
+def load_model(name: str):
+    """Load a Whisper model, through a snapshot in MODEL_SNAPSHOT_DIR when one is set
+
+    The first load converts the checkpoint and writes the snapshot; every
+    load then maps it rather than holding a private copy of the weights.
+    Snapshots are for CPU inference.
+    """
+    import whisper
+
+    if not config.MODEL_SNAPSHOT_DIR:
+        return whisper.load_model(name)
+    path = snapshot_path(name)
+    if not os.path.exists(path):
+        write_snapshot(whisper.load_model(name, device="cpu"), path)
+        print(f"Wrote model snapshot {path}")
+    return load_snapshot(path)
+
+
+class ModelEntry:
+    def __init__(self, name: str, model, load_seconds: float, rss_delta: int, backend: str = "fp32"):
+        self.name = name
+        self.backend = backend
+        self.model = model
+        self.load_seconds = load_seconds
+        self.rss_delta = rss_delta
+        self.param_bytes = model_bytes(model)
+        self.loaded_at = time.time()
+        self.uses = 0
+        # Whisper installs kv-cache hooks on the model during decoding,
+        # so a single instance must not run two inferences at once.
+        self.lock = threading.Lock()
+
+
+class ModelRegistry:
+    """Process-wide cache of loaded Whisper models with LRU eviction
+
+    Models are keyed by (name, backend), so the same size can be resident
+    in more than one precision.
+    """
+
+    def __init__(self, max_models: int = config.MAX_RESIDENT_MODELS):
+        self.max_models = max(1, max_models)
+        self._models = OrderedDict()
+        self._lock = threading.Lock()
+        self._load_locks = {}
+        self.evictions = 0
+
+    def _load_lock(self, key: tuple) -> threading.Lock:
+        with self._lock:
+            return self._load_locks.setdefault(key, threading.Lock())
+
+    def get(self, name: str, backend: str = None) -> ModelEntry:
+        """Return the entry for a model and backend, loading it on first use"""
+        key = (name, backend or config.BACKEND)
+        with self._lock:
+            entry = self._models.get(key)
+            if entry is not None:
+                self._models.move_to_end(key)
+                return entry
+
+        # Only one thread loads a given model; others wait for it
+        with self._load_lock(key):
+            with self._lock:
+                entry = self._models.get(key)
+                if entry is not None:
+                    self._models.move_to_end(key)
+                    return entry
+
+            print(f"Loading Whisper model '{name}' ({key[1]})...")
+            rss_before = rss_bytes()
+            start = time.perf_counter()
+            import backends
+            with metrics.span("model_load"):
+                model = backends.prepare(load_model(name), key[1])
+            entry = ModelEntry(name, model, time.perf_counter() - start, rss_bytes() - rss_before, key[1])
+            print(f"Model '{name}' ({key[1]}) loaded in {entry.load_seconds:.2f} seconds")
+
+            with self._lock:
+                self._models[key] = entry
+                while len(self._models) > self.max_models:
+                    (evicted, evicted_backend), _ = self._models.popitem(last=False)
+                    self.evictions += 1
+                    print(f"Evicted Whisper model '{evicted}' ({evicted_backend})")
+            return entry
+
+    @contextmanager
+    def use(self, name: str = None, backend: str = None):
+        """Borrow a model for one inference call"""
+        entry = self.get(name or config.DEFAULT_MODEL, backend)
+        with entry.lock:
+            entry.uses += 1
+            yield entry.model
+
+    def preload(self, names=None):
+        for name in names or config.WHISPER_MODELS:
+            self.get(name)
+
+    def status(self) -> dict:
+        with self._lock:
+            entries = list(self._models.values())
+        return {
+            "max_models": self.max_models,
+            "evictions": self.evictions,
+            "rss_mb": round(rss_bytes() / 2**20, 1),
+            "models": [
+                {
+                    "name": e.name,
+                    "backend": e.backend,
+                    "load_seconds": round(e.load_seconds, 3),
+                    "param_mb": round(e.param_bytes / 2**20, 1),
+                    "rss_delta_mb": round(e.rss_delta / 2**20, 1),
+                    "uses": e.uses,
+                    "busy": e.lock.locked(),
+                }
+                for e in entries
+            ],
+        }
+
+
+registry = ModelRegistry()
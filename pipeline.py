@@ -0,0 +1,369 @@
+import asyncio
+import hashlib
+import math
+import os
+import queue
+import subprocess
+import threading
+import time
+import urllib.request
+from collections import deque
+from contextlib import contextmanager
+
+import numpy as np
+
+from audio_io import SAMPLE_RATE, ffmpeg_pcm_command
+
+DOWNLOAD_BLOCK_BYTES = 256 * 1024
+RANGE_BYTES = 10 * 1024 * 1024  # YouTube throttles long unranged reads
+# Seconds a connect or read may stall before the download fails, so a dead connection cannot hold its thread
+DOWNLOAD_TIMEOUT = 30
+
+# Timings of recently finished pipelines, for GET /status
+recent_runs = deque(maxlen=20)
+
+
+def percentile(values, q: float) -> float:
+    """Nearest-rank percentile, q in [0, 100]"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(q / 100 * len(ordered)) - 1))]
+
+
+class StageStats:
+    """Wall-clock and busy time for one pipeline stage"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.started = None
+        self.finished = None
+        self.busy_seconds = 0.0
+        self.items = 0
+        self.bytes = 0
+        self.latencies = deque(maxlen=10000)
+
+    def start(self):
+        if self.started is None:
+            self.started = time.perf_counter()
+
+    def finish(self):
+        self.finished = time.perf_counter()
+
+    @contextmanager
+    def busy(self):
+        self.start()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.busy_seconds += time.perf_counter() - start
+
+    def record(self, seconds: float, items: int = 1):
+        """Count items that took seconds of busy time together, e.g. one batch of chunks
+
+        Each item waited the whole time, so that is its latency; the cost
+        amortized over the batch is busy_seconds / items.
+        """
+        self.start()
+        self.busy_seconds += seconds
+        self.items += items
+        self.latencies.extend([seconds] * items)
+
+    def as_dict(self, origin: float) -> dict:
+        def rel(t):
+            return round(t - origin, 3) if t is not None else None
+        return {
+            "started": rel(self.started),
+            "finished": rel(self.finished),
+            "busy_seconds": round(self.busy_seconds, 3),
+            "items": self.items,
+            "bytes": self.bytes,
+            "p50_seconds": round(percentile(self.latencies, 50), 3),
+            "p95_seconds": round(percentile(self.latencies, 95), 3),
+            "seconds_per_item": round(self.busy_seconds / self.items, 4) if self.items else None,
+        }
+
+
+class StreamPipeline:
+    """Decode a byte stream with ffmpeg into a bounded queue of PCM blocks
+
+    Bytes queued by the first stage are written to ffmpeg's stdin while a
+    reader thread collects 16 kHz PCM blocks from its stdout, so the
+    caller can run inference on blocks() while input is still arriving.
+    """
+
+    def __init__(self, source_stage: str, block_seconds: float = 10.0, max_bytes_queued: int = 64,
+                 max_blocks_queued: int = 8, start: float = 0.0):
+        self.start_offset = start
+        self.block_bytes = int(block_seconds * SAMPLE_RATE) * 4
+        self.stats = {name: StageStats(name) for name in (source_stage, "decode", "inference")}
+        self.created = time.perf_counter()
+        self.error = None
+        self._bytes = queue.Queue(maxsize=max_bytes_queued)
+        self._pcm = queue.Queue(maxsize=max_blocks_queued)
+        self._cancelled = threading.Event()  # stages should stop producing
+        self._closed = threading.Event()  # the consumer has gone away
+        self._process = None
+        self._file = None
+        self._stderr = None
+        self._stderr_lock = threading.Lock()
+
+    def _put(self, q: queue.Queue, item) -> bool:
+        while not self._cancelled.is_set():
+            try:
+                q.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _end_blocks(self):
+        while not self._closed.is_set():
+            try:
+                self._pcm.put(None, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+    def _fail(self, error: Exception):
+        if self.error is None:
+            self.error = error
+        self._cancelled.set()
+
+    def _decoder_error(self):
+        """ffmpeg's own error once it has exited with one, e.g. on input it cannot decode; None otherwise
+
+        Read once under a lock, as both decoder threads may ask.
+        """
+        try:
+            if self._process.wait(timeout=5) == 0:
+                return None
+        except subprocess.TimeoutExpired:
+            return None
+        with self._stderr_lock:
+            if self._stderr is None:
+                self._stderr = self._process.stderr.read().decode(errors="replace").strip()
+        return RuntimeError(f"Failed to decode audio: {self._stderr}")
+
+    def _start_decoder(self, source: str = "pipe:0"):
+        piped = source == "pipe:0"
+        self._process = subprocess.Popen(
+            ffmpeg_pcm_command(source, start=self.start_offset),
+            stdin=subprocess.PIPE if piped else subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+        if piped:
+            threading.Thread(target=self._feed_decoder, daemon=True).start()
+
+    def _feed_decoder(self):
+        """Stage 2a: pass queued bytes to ffmpeg's stdin"""
+        try:
+            while not self._cancelled.is_set():
+                try:
+                    data = self._bytes.get(timeout=0.5)
+                except queue.Empty:
+                    continue
+                if data is None:
+                    break
+                self._process.stdin.write(data)
+        except BrokenPipeError as e:
+            # ffmpeg stopped reading, usually because it rejected the input
+            self._fail(self._decoder_error() or e)
+        except ValueError as e:
+            self._fail(e)
+        finally:
+            try:
+                self._process.stdin.close()
+            except (BrokenPipeError, ValueError):
+                pass
+
+    def _read_decoder(self):
+        """Stage 2b: read 16 kHz PCM blocks from ffmpeg's stdout"""
+        stats = self.stats["decode"]
+        stats.start()
+        try:
+            while True:
+                with stats.busy():
+                    data = self._process.stdout.read(self.block_bytes)
+                if not data:
+                    break
+                stats.items += 1
+                stats.bytes += len(data)
+                if not self._put(self._pcm, np.frombuffer(data, dtype=np.float32)):
+                    return
+            if not self._cancelled.is_set() and (error := self._decoder_error()) is not None:
+                raise error
+        except Exception as e:
+            self._fail(e)
+        finally:
+            stats.finish()
+            self._end_blocks()
+
+    def blocks(self):
+        """PCM blocks in order as they are decoded; raises if a stage failed"""
+        while not self._closed.is_set():
+            try:
+                block = self._pcm.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            if block is None:
+                break
+            yield block
+        if self.error is not None:
+            raise self.error
+
+    def cancel(self):
+        """Stop all stages and remove any temporary download"""
+        self._cancelled.set()
+        self._closed.set()
+        if self._process is not None and self._process.poll() is None:
+            self._process.kill()
+        if self._file and os.path.exists(self._file):
+            os.remove(self._file)
+
+    def summary(self) -> dict:
+        return {
+            "total_seconds": round(time.perf_counter() - self.created, 3),
+            "stages": {name: stats.as_dict(self.created) for name, stats in self.stats.items()},
+        }
+
+
+class UrlPipeline(StreamPipeline):
+    """Download, decode and transcribe a URL concurrently over bounded queues
+
+    A downloader thread fetches the audio stream into the byte queue.
+    Streams that cannot be fetched over plain HTTP are downloaded to a
+    file by yt-dlp first and decoded from there.
+    """
+
+    def __init__(self, url: str, block_seconds: float = 10.0, outdir: str = "uploads", start: float = 0.0):
+        super().__init__("download", block_seconds, start=start)
+        self.url = url
+        self.outdir = outdir
+        self.title = None
+
+    def _resolve(self) -> dict:
+        import yt_dlp
+        ydl_opts = {
+            'format': 'bestaudio[ext=webm]/bestaudio[protocol^=http]/bestaudio/best',
+            'nocheckcertificate': True,
+            'quiet': True,
+        }
+        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+            return ydl.extract_info(self.url, download=False)
+
+    def _download(self, info: dict):
+        """Stage 1: stream the media bytes over HTTP in ranged requests"""
+        stats = self.stats["download"]
+        stats.start()
+        try:
+            position = 0
+            while not self._cancelled.is_set():
+                request = urllib.request.Request(info["url"], headers=info.get("http_headers") or {})
+                request.add_header("Range", f"bytes={position}-{position + RANGE_BYTES - 1}")
+                received = 0
+                with urllib.request.urlopen(request, timeout=DOWNLOAD_TIMEOUT) as response:
+                    ranged = response.status == 206
+                    while True:
+                        with stats.busy():
+                            data = response.read(DOWNLOAD_BLOCK_BYTES)
+                        if not data:
+                            break
+                        received += len(data)
+                        stats.items += 1
+                        stats.bytes += len(data)
+                        if not self._put(self._bytes, data):
+                            return
+                position += received
+                if not ranged or received < RANGE_BYTES:
+                    break
+        except TimeoutError:
+            self._fail(RuntimeError(f"Download stalled for more than {DOWNLOAD_TIMEOUT} seconds"))
+        except Exception as e:
+            self._fail(e)
+        finally:
+            stats.finish()
+            self._put(self._bytes, None)
+
+    def _download_file(self):
+        """Stage 1 fallback: let yt-dlp fetch fragmented streams to disk"""
+        import yt_dlp
+        stats = self.stats["download"]
+        try:
+            with stats.busy():
+                ydl_opts = {'format': 'bestaudio/best', 'outtmpl': f'{self.outdir}/%(id)s.%(ext)s',
+                            'nocheckcertificate': True}
+                with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+                    info = ydl.extract_info(self.url, download=True)
+                    self._file = ydl.prepare_filename(info)
+            stats.bytes = os.path.getsize(self._file)
+        finally:
+            stats.finish()
+
+    def _run(self):
+        try:
+            info = self._resolve()
+            self.title = info.get("title")
+            direct = info.get("url") and info.get("protocol", "https") in ("http", "https")
+            if direct:
+                threading.Thread(target=self._download, args=(info,), daemon=True).start()
+                self._start_decoder()
+            else:
+                self._download_file()
+                self._start_decoder(self._file)
+            self._read_decoder()
+        except Exception as e:
+            self._fail(e)
+            self._end_blocks()
+
+    def start(self):
+        threading.Thread(target=self._run, daemon=True).start()
+        return self.blocks()
+
+    def summary(self) -> dict:
+        return {"url": self.url, "title": self.title, **super().summary()}
+
+
+class UploadPipeline(StreamPipeline):
+    """Decode an upload while its request body is still arriving"""
+
+    def __init__(self, block_seconds: float = 10.0):
+        super().__init__("upload", block_seconds)
+        self.digest = hashlib.sha256()
+
+    def start(self):
+        try:
+            self._start_decoder()
+            threading.Thread(target=self._read_decoder, daemon=True).start()
+        except Exception as e:
+            self._fail(e)
+            self._end_blocks()
+        return self.blocks()
+
+    async def _put_async(self, item):
+        # Back-pressure the request body without blocking the event loop
+        while True:
+            if self._cancelled.is_set():
+                raise self.error or RuntimeError("Upload pipeline stopped")
+            try:
+                self._bytes.put_nowait(item)
+                return
+            except queue.Full:
+                await asyncio.sleep(0.05)
+
+    async def feed(self, data: bytes):
+        stats = self.stats["upload"]
+        stats.start()
+        stats.items += 1
+        stats.bytes += len(data)
+        self.digest.update(data)
+        await self._put_async(data)
+
+    async def end(self):
+        self.stats["upload"].finish()
+        await self._put_async(None)
+
+    def summary(self) -> dict:
+        return {"sha256": self.digest.hexdigest(), **super().summary()}
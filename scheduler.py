@@ -0,0 +1,169 @@
+import asyncio
+import time
+from collections import OrderedDict, deque
+
+import config
+import metrics
+from worker_pool import inference_pool, import_inference
+
+
+class _Request:
+    __slots__ = ("window", "future", "queued", "job")
+
+    def __init__(self, window, future: asyncio.Future):
+        self.window = window
+        self.future = future
+        self.queued = time.perf_counter()
+        self.job = metrics.current_job.get()
+
+
+class BatchScheduler:
+    """Batch windows from every running job into shared inference calls
+
+    Jobs queue windows per (model, backend, word timestamps). A dispatcher sends a batch as
+    soon as max_batch windows are waiting, or once the oldest has waited
+    max_wait_ms. Batches are filled one window per job in turn, so a long
+    file cannot starve a short one. A running batch is cancelled once
+    every job waiting for it has gone.
+    """
+
+    def __init__(self, max_batch: int, max_wait_ms: float, concurrency: int):
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max(0.0, max_wait_ms) / 1000
+        self.concurrency = max(1, concurrency)
+        self._queues = {}  # (model, backend, word timestamps) -> OrderedDict of job -> deque of requests
+        self._arrived = None
+        self._dispatcher = None
+        self._running = {}  # task -> its batch
+        self.batches = 0
+        self.cancelled_batches = 0
+        self.windows = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    async def transcribe(self, job, model: str, backend: str, windows: list, word_timestamps: bool = False) -> list:
+        """Segments for each window, once the batches holding them have run"""
+        loop = asyncio.get_running_loop()
+        if self._dispatcher is None or self._dispatcher.done():
+            self._arrived = asyncio.Event()
+            self._dispatcher = loop.create_task(self._dispatch())
+
+        requests = [_Request(window, loop.create_future()) for window in windows]
+        jobs = self._queues.setdefault((model, backend, word_timestamps), OrderedDict())
+        jobs.setdefault(job, deque()).extend(requests)
+        self._arrived.set()
+        try:
+            return await asyncio.gather(*(request.future for request in requests))
+        finally:
+            # Windows not yet batched are skipped once their job stops waiting
+            for request in requests:
+                request.future.cancel()
+            for task, batch in list(self._running.items()):
+                if all(r.future.cancelled() for r in batch):
+                    del self._running[task]
+                    self.cancelled_batches += 1
+                    task.cancel()
+
+    def _oldest(self):
+        """(key, queued time) of the group whose first live window has waited longest"""
+        oldest = (None, None)
+        for key, jobs in list(self._queues.items()):
+            for job, queue in list(jobs.items()):
+                while queue and queue[0].future.done():
+                    queue.popleft()
+                if not queue:
+                    del jobs[job]
+                elif oldest[1] is None or queue[0].queued < oldest[1]:
+                    oldest = (key, queue[0].queued)
+            if not jobs:
+                del self._queues[key]
+        return oldest
+
+    def _take(self, key) -> list:
+        """Up to max_batch windows for key, one per job in turn"""
+        jobs = self._queues.get(key) or OrderedDict()
+        batch = []
+        while jobs and len(batch) < self.max_batch:
+            job, queue = next(iter(jobs.items()))
+            jobs.move_to_end(job)
+            while queue and queue[0].future.done():
+                queue.popleft()
+            if queue:
+                batch.append(queue.popleft())
+            if not queue:
+                del jobs[job]
+        if not jobs:
+            self._queues.pop(key, None)
+        return batch
+
+    async def _dispatch(self):
+        slots = asyncio.Semaphore(self.concurrency)
+        while True:
+            key, queued = self._oldest()
+            if key is None:
+                self._arrived.clear()
+                await self._arrived.wait()
+                continue
+
+            # Give other jobs until the oldest window's deadline to fill the batch
+            waiting = sum(len(queue) for queue in self._queues[key].values())
+            delay = queued + self.max_wait - time.perf_counter()
+            if waiting < self.max_batch and delay > 0:
+                self._arrived.clear()
+                try:
+                    await asyncio.wait_for(self._arrived.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            await slots.acquire()
+            batch = self._take(key)
+            if not batch:
+                slots.release()
+                continue
+            task = asyncio.create_task(self._run(key, batch, slots))
+            self._running[task] = batch
+            task.add_done_callback(lambda done: self._running.pop(done, None))
+
+    async def _run(self, key, batch: list, slots: asyncio.Semaphore):
+        await import_inference()
+        from batch_engine import transcribe_batch
+
+        started = time.perf_counter()
+        for request in batch:
+            wait = started - request.queued
+            self._wait_total += wait
+            self._wait_max = max(self._wait_max, wait)
+        self.batches += 1
+        self.windows += len(batch)
+        # Spans and profiles of a shared batch count towards every job in it
+        metrics.current_job.set(",".join(sorted({r.job for r in batch if r.job})) or None)
+        try:
+            model, backend, word_timestamps = key
+            results = await inference_pool.run(transcribe_batch, model, [r.window for r in batch], backend=backend,
+                                               word_timestamps=word_timestamps)
+            for request, segments in zip(batch, results):
+                if not request.future.done():
+                    request.future.set_result(segments)
+        except Exception as e:
+            for request in batch:
+                if not request.future.done():
+                    request.future.set_exception(e)
+        finally:
+            slots.release()
+
+    def status(self) -> dict:
+        return {
+            "max_batch": self.max_batch,
+            "max_wait_ms": round(self.max_wait * 1000, 1),
+            "jobs_waiting": sum(len(jobs) for jobs in self._queues.values()),
+            "windows_queued": sum(len(q) for jobs in self._queues.values() for q in jobs.values()),
+            "batches": self.batches,
+            "cancelled_batches": self.cancelled_batches,
+            "avg_batch_size": round(self.windows / self.batches, 2) if self.batches else 0.0,
+            "avg_wait_ms": round(self._wait_total / self.windows * 1000, 1) if self.windows else 0.0,
+            "max_wait_ms_seen": round(self._wait_max * 1000, 1),
+        }
+
+
+scheduler = BatchScheduler(config.BATCH_SIZE, config.BATCH_MAX_WAIT_MS, config.INFERENCE_WORKERS)
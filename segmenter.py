@@ -0,0 +1,180 @@
+import re
+
+import numpy as np
+
+SAMPLE_RATE = 16000
+FRAME_SIZE = 320  # 20 ms energy frames
+MAX_CHUNK_SECONDS = 30.0
+
+
+def fixed_chunks(n_samples: int, chunk_seconds: float = MAX_CHUNK_SECONDS) -> list:
+    """Back-to-back (start, end) sample ranges of equal length"""
+    size = int(chunk_seconds * SAMPLE_RATE)
+    return [(i, min(i + size, n_samples)) for i in range(0, n_samples, size)]
+
+
+def frame_energy_db(audio: np.ndarray) -> np.ndarray:
+    """RMS energy in dBFS for each 20 ms frame"""
+    n_frames = len(audio) // FRAME_SIZE
+    if n_frames == 0:
+        return np.zeros(0, dtype=np.float32)
+    frames = audio[:n_frames * FRAME_SIZE].reshape(n_frames, FRAME_SIZE)
+    rms = np.sqrt(np.mean(frames.astype(np.float32) ** 2, axis=1))
+    return 20 * np.log10(np.maximum(rms, 1e-10))
+
+
+def speech_regions(energy_db: np.ndarray, min_silence: float = 0.5, min_speech: float = 0.1, pad: float = 0.2,
+                   peak_db: float = None) -> list:
+    """(start, end) frame ranges that contain speech, from frame energies
+
+    The threshold adapts to the recording: 12 dB above its noise floor
+    (capped at 20 dB below its peak, for audio with no pauses at all), but
+    never below -60 dBFS. peak_db overrides the peak when only part of
+    the recording is in view.
+    """
+    if len(energy_db) == 0:
+        return []
+    frame_seconds = FRAME_SIZE / SAMPLE_RATE
+    peak = energy_db.max() if peak_db is None else max(peak_db, energy_db.max())
+    threshold = max(min(np.percentile(energy_db, 10) + 12.0, peak - 20.0), -60.0)
+    voiced = np.concatenate(([False], energy_db > threshold, [False]))
+    edges = np.flatnonzero(np.diff(voiced.astype(np.int8)))
+    regions = []
+    for start, end in zip(edges[::2], edges[1::2]):
+        # Bridge pauses too short to be worth cutting
+        if regions and (start - regions[-1][1]) * frame_seconds < min_silence:
+            regions[-1][1] = end
+        else:
+            regions.append([start, end])
+
+    pad_frames = int(pad / frame_seconds)
+    return [
+        (max(0, start - pad_frames), min(len(energy_db), end + pad_frames))
+        for start, end in regions
+        if (end - start) * frame_seconds >= min_speech
+    ]
+
+
+def vad_chunks(audio: np.ndarray, max_seconds: float = MAX_CHUNK_SECONDS, overlap: float = 0.5,
+               min_silence: float = 0.5, peak_db: float = None) -> list:
+    """(start, end) sample ranges covering only speech, cut in pauses
+
+    Speech regions are packed into chunks of at most max_seconds. A region
+    longer than that is cut at the quietest frame of the chunk's last few
+    seconds, and the next chunk starts overlap seconds earlier so a word
+    on the cut is heard whole by one of them.
+    """
+    energy = frame_energy_db(audio)
+    max_frames = int(max_seconds * SAMPLE_RATE / FRAME_SIZE)
+    overlap_frames = int(overlap * SAMPLE_RATE / FRAME_SIZE)
+    search_frames = max_frames // 6
+
+    chunks = []
+    current = None
+    for start, end in speech_regions(energy, min_silence=min_silence, peak_db=peak_db):
+        if current is not None and end - current[0] > max_frames:
+            chunks.append(current)
+            current = None
+        if current is None:
+            current = [start, end]
+        current[1] = end
+        # Split regions that alone exceed the window
+        while current[1] - current[0] > max_frames:
+            limit = current[0] + max_frames
+            window = energy[limit - search_frames:limit]
+            cut = limit - search_frames + int(np.argmin(window))
+            chunks.append([current[0], cut])
+            current = [max(current[0] + 1, cut - overlap_frames), current[1]]
+    if current is not None:
+        chunks.append(current)
+
+    return [(int(start) * FRAME_SIZE, min(len(audio), int(end) * FRAME_SIZE)) for start, end in chunks]
+
+
+def _normalize(text: str) -> str:
+    return re.sub(r"[^\w\s]", "", text).lower().strip()
+
+
+class SeamStitcher:
+    """Drops segments repeated across overlapping chunk boundaries
+
+    Segments must be fed in chunk order with absolute timestamps.
+    """
+
+    def __init__(self, tolerance: float = 0.3):
+        self.tolerance = tolerance
+        self.last_end = 0.0
+        self.last_text = ""
+
+    def feed(self, segments) -> list:
+        kept = []
+        for segment in segments:
+            text = _normalize(segment["text"])
+            if segment["start"] < self.last_end:
+                # Starts inside audio the previous chunk already covered
+                if segment["end"] <= self.last_end + self.tolerance:
+                    continue
+                if text and text in self.last_text:
+                    continue
+            segment["start"] = max(segment["start"], self.last_end)
+            self.last_end = segment["end"]
+            self.last_text = text
+            kept.append(segment)
+        return kept
+
+
+class StreamingChunker:
+    """Plans chunks incrementally from PCM blocks as they are decoded
+
+    Only a bounded tail of audio is buffered. A planned chunk is released
+    once lookahead seconds of audio follow it, so later blocks can no
+    longer move its cut point.
+    """
+
+    def __init__(self, strategy: str = "vad", max_seconds: float = MAX_CHUNK_SECONDS, overlap: float = 0.5,
+                 min_silence: float = 0.5, lookahead: float = 5.0):
+        self.strategy = strategy
+        self.max_seconds = max_seconds
+        self.overlap = overlap
+        self.min_silence = min_silence
+        self.lookahead = int(lookahead * SAMPLE_RATE)
+        self.max_samples = int(max_seconds * SAMPLE_RATE)
+        self.buffer = np.zeros(0, dtype=np.float32)
+        self.offset = 0  # absolute sample index of buffer[0]
+        self.samples_seen = 0
+        self.samples_planned = 0
+        self.peak_db = None  # loudest frame so far, so silent stretches are judged against speech
+
+    def _plan(self) -> list:
+        if self.strategy == "vad":
+            return vad_chunks(self.buffer, self.max_seconds, self.overlap, self.min_silence, self.peak_db)
+        return fixed_chunks(len(self.buffer), self.max_seconds)
+
+    def _release(self, final: bool) -> list:
+        chunks = self._plan()
+        safe_end = len(self.buffer) if final else len(self.buffer) - self.lookahead
+        ready = [(start, end) for start, end in chunks if end <= safe_end]
+        remaining = chunks[len(ready):]
+
+        released = [(self.offset + start, self.buffer[start:end]) for start, end in ready]
+        self.samples_planned += sum(end - start for start, end in ready)
+
+        keep_from = len(self.buffer) if final else remaining[0][0] if remaining else max(0, safe_end)
+        self.buffer = self.buffer[keep_from:]
+        self.offset += keep_from
+        return released
+
+    def feed(self, block: np.ndarray) -> list:
+        """Add decoded samples; returns (absolute_start_sample, chunk) pairs now final"""
+        self.samples_seen += len(block)
+        energy = frame_energy_db(np.asarray(block, dtype=np.float32))
+        if len(energy):
+            self.peak_db = energy.max() if self.peak_db is None else max(self.peak_db, energy.max())
+        self.buffer = np.concatenate((self.buffer, np.asarray(block, dtype=np.float32)))
+        if len(self.buffer) < self.max_samples + self.lookahead:
+            return []
+        return self._release(final=False)
+
+    def finish(self) -> list:
+        """Plan whatever is left once the input has ended"""
+        return self._release(final=True)
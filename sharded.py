@@ -0,0 +1,90 @@
+import asyncio
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from segmenter import StreamingChunker, SAMPLE_RATE
+
+
+def _init_worker(threads: int):
+    # Each worker process runs its own model with a fixed intra-op thread count
+    import torch
+    torch.set_num_threads(threads)
+
+
+def transcribe_ranges(model_name: str, pcm_path: str, ranges: list, backend: str = None,
+                      word_timestamps: bool = False) -> list:
+    """Worker task: transcribe (start, end) sample ranges of a raw float32 PCM file"""
+    from batch_engine import transcribe_batch
+
+    audio = np.memmap(pcm_path, dtype=np.float32, mode="r")
+    return transcribe_batch(model_name, [audio[start:end] for start, end in ranges], backend=backend,
+                            word_timestamps=word_timestamps)
+
+
+def plan_ranges(pcm: np.ndarray, strategy: str = "vad", overlap: float = 0.5, min_silence: float = 0.5,
+                block_seconds: float = 60.0) -> list:
+    """(start, end) sample ranges of every chunk, planned block by block to keep memory flat"""
+    chunker = StreamingChunker(strategy, overlap=overlap, min_silence=min_silence)
+    block = int(block_seconds * SAMPLE_RATE)
+    ranges = []
+    # Keep only the bounds: chunks are views that would hold the chunker's buffers, and so the whole file, alive
+    for i in range(0, len(pcm), block):
+        ranges.extend((offset, offset + len(chunk)) for offset, chunk in chunker.feed(pcm[i:i + block]))
+    ranges.extend((offset, offset + len(chunk)) for offset, chunk in chunker.finish())
+    return ranges
+
+
+class ShardPool:
+    """Worker processes that transcribe chunk ranges of one recording in parallel"""
+
+    def __init__(self, workers: int, threads: int):
+        self.workers = workers
+        self.threads = threads
+        self._executor = ProcessPoolExecutor(
+            workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(threads,),
+        )
+        self.active_tasks = 0
+        self.completed_tasks = 0
+        self._lock = threading.Lock()
+
+    def _task_done(self, future):
+        # Counted here so tasks that fail, are cancelled or finish after the stream closed are all let go
+        with self._lock:
+            self.active_tasks -= 1
+            if not future.cancelled() and future.exception() is None:
+                self.completed_tasks += 1
+
+    async def transcribe(self, model_name: str, pcm_path: str, ranges: list, batch_size: int, backend: str = None,
+                         word_timestamps: bool = False):
+        """Yield (ranges, results) per batch in timestamp order, each as soon as it and all before it are done"""
+        batches = [ranges[i:i + batch_size] for i in range(0, len(ranges), batch_size)]
+        futures = [self._executor.submit(transcribe_ranges, model_name, pcm_path, batch, backend, word_timestamps)
+                   for batch in batches]
+        with self._lock:
+            self.active_tasks += len(futures)
+        for future in futures:
+            future.add_done_callback(self._task_done)
+        try:
+            for batch, future in zip(batches, futures):
+                yield batch, await asyncio.wrap_future(future)
+        finally:
+            # Drop batches not started yet if the stream ends early
+            for future in futures:
+                future.cancel()
+
+    def shutdown(self):
+        self._executor.shutdown(cancel_futures=True)
+
+    def status(self) -> dict:
+        return {
+            "workers": self.workers,
+            "threads_per_worker": self.threads,
+            "active_tasks": self.active_tasks,
+            "completed_tasks": self.completed_tasks,
+        }
@@ -0,0 +1,269 @@
+import os
+import re
+import shutil
+import threading
+import uuid
+
+import config
+
+# Workspaces named tmp-<pid>-<boot>-* hold files only needed while a job in that process runs.
+# The boot token tells this process's workspaces from those of an earlier one given the same pid,
+# as happens on every restart in a container.
+TEMPORARY_PREFIX = "tmp-"
+BOOT = uuid.uuid4().hex[:8]
+
+
+def safe_filename(name: str, default: str = "upload") -> str:
+    """A client-supplied file name reduced to a plain base name of letters, digits, '.', '_' and '-'"""
+    name = os.path.basename((name or "").replace("\\", "/"))
+    name = re.sub(r"[^A-Za-z0-9._-]+", "_", name).strip("._")
+    stem, ext = os.path.splitext(name)
+    ext = ext[:16]
+    return (stem[:100 - len(ext)] + ext) if stem else default
+
+
+def _size(path: str) -> int:
+    if not os.path.isdir(path):
+        try:
+            return os.path.getsize(path)
+        except OSError:
+            return 0
+    total = 0
+    for directory, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(directory, name))
+            except OSError:
+                pass
+    return total
+
+
+def _orphaned(name: str) -> bool:
+    """Whether a temporary workspace's process has exited"""
+    pid, _, rest = name[len(TEMPORARY_PREFIX):].partition("-")
+    if not pid.isdigit() or "-" not in rest:
+        return True
+    if int(pid) == os.getpid():
+        return rest.split("-")[0] != BOOT
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return True
+    except OSError:
+        pass
+    return False
+
+
+def _remove(path: str):
+    if os.path.isdir(path):
+        shutil.rmtree(path, ignore_errors=True)
+    elif os.path.exists(path):
+        os.remove(path)
+
+
+class Workspace:
+    """A job's own directory under the storage root, plus a scratch directory for decoded PCM
+
+    Names are unique per workspace, so concurrent jobs never share a
+    file. The workspace is pinned, and so safe from quota cleanup, until
+    it is released.
+    """
+
+    def __init__(self, storage, name: str):
+        self.storage = storage
+        self.name = name
+        self.path = os.path.join(storage.root, name)
+        self._scratch = os.path.join(storage.scratch_root, name) if storage.scratch_root else None
+        self._released = False
+        os.makedirs(self.path)
+
+    @property
+    def temporary(self) -> bool:
+        return self.name.startswith(TEMPORARY_PREFIX)
+
+    def file(self, name: str) -> str:
+        """Path for a file in the workspace; name is sanitised"""
+        return os.path.join(self.path, safe_filename(name))
+
+    def scratch(self, name: str, nbytes: int = 0) -> str:
+        """Path for a file only needed while the job runs, in the RAM-backed area when it has nbytes free"""
+        if self._scratch is not None:
+            try:
+                os.makedirs(self._scratch, exist_ok=True)
+                if shutil.disk_usage(self._scratch).free > nbytes:
+                    return os.path.join(self._scratch, safe_filename(name))
+            except OSError as e:
+                print(f"Scratch area unavailable, using {self.path}: {str(e)}")
+        return self.file(name)
+
+    def release(self, keep: bool = None):
+        """Unpin the workspace and remove its scratch files
+
+        Kept workspaces stay until quota cleanup; the rest, by default
+        temporary ones, are deleted now.
+        """
+        if self._released:
+            return
+        self._released = True
+        if self._scratch is not None:
+            _remove(self._scratch)
+        keep = not self.temporary if keep is None else keep
+        if keep:
+            self.storage.touch(self.path)
+            self.storage.added(_size(self.path))
+        else:
+            _remove(self.path)
+        self.storage.unpin(self.path)
+
+
+class StorageManager:
+    """Job workspaces under one directory, kept within a byte quota
+
+    Every entry of the root (a workspace, or a file saved before
+    workspaces existed) is evicted least-recently-used, by modification
+    time, once the total goes over the quota. Entries in use by a running
+    job are pinned and never evicted.
+    """
+
+    def __init__(self, root: str, quota_bytes: int, scratch_root: str = ""):
+        self.root = root
+        self.quota_bytes = quota_bytes
+        self.scratch_root = scratch_root
+        self._pinned = {}  # entry path -> number of jobs using it
+        self._lock = threading.Lock()
+        # Running totals, recounted by make_room and added to as workspaces are kept, so
+        # status and metrics never walk the tree
+        self.used_bytes = 0
+        self.entries = 0
+        self.evictions = 0
+        self.evicted_bytes = 0
+
+    def workspace(self, temporary: bool = False) -> Workspace:
+        """A new pinned workspace; temporary ones are deleted on release"""
+        os.makedirs(self.root, exist_ok=True)
+        prefix = f"{TEMPORARY_PREFIX}{os.getpid()}-{BOOT}-" if temporary else ""
+        workspace = Workspace(self, prefix + uuid.uuid4().hex)
+        self._pin_entry(workspace.path)
+        return workspace
+
+    def _entry(self, path: str):
+        """The root entry a path lies in, or None for paths outside the root"""
+        root = os.path.realpath(self.root)
+        path = os.path.realpath(path)
+        if os.path.commonpath([root, path]) != root or path == root:
+            return None
+        return os.path.join(self.root, os.path.relpath(path, root).split(os.sep)[0])
+
+    def _pin_entry(self, entry: str):
+        with self._lock:
+            self._pinned[entry] = self._pinned.get(entry, 0) + 1
+
+    def pin(self, path: str):
+        """Protect the entry holding path while a job reads it; returns a handle for unpin"""
+        entry = self._entry(path)
+        if entry is not None:
+            self._pin_entry(entry)
+            self.touch(entry)
+        return entry
+
+    def unpin(self, entry: str):
+        if entry is None:
+            return
+        with self._lock:
+            count = self._pinned.get(entry, 0) - 1
+            if count > 0:
+                self._pinned[entry] = count
+            else:
+                self._pinned.pop(entry, None)
+
+    def touch(self, path: str):
+        """Mark an entry as just used"""
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+    def _entries(self) -> list:
+        """(modified, path, bytes) of every root entry"""
+        if not os.path.isdir(self.root):
+            return []
+        entries = []
+        for entry in os.scandir(self.root):
+            try:
+                modified = entry.stat().st_mtime
+            except OSError:
+                continue
+            entries.append((modified, entry.path, _size(entry.path)))
+        return entries
+
+    def added(self, nbytes: int):
+        with self._lock:
+            self.used_bytes += nbytes
+            self.entries += 1
+
+    def usage(self) -> int:
+        return self.used_bytes
+
+    def _in_use(self, path: str) -> bool:
+        # Temporary workspaces may belong to another server process sharing the directory
+        name = os.path.basename(path)
+        return path in self._pinned or (name.startswith(TEMPORARY_PREFIX) and not _orphaned(name))
+
+    def make_room(self, nbytes: int = 0) -> bool:
+        """Evict least recently used entries until nbytes more fit; False if pinned ones leave no room
+
+        Walks the whole tree, so call it from a worker thread.
+        """
+        with self._lock:
+            entries = sorted(self._entries())
+            used = sum(size for _, _, size in entries)
+            self.used_bytes, self.entries = used, len(entries)
+            in_use = {path for _, path, _ in entries if self._in_use(path)}
+            pinned = sum(size for _, path, size in entries if path in in_use)
+            if nbytes and pinned + nbytes > self.quota_bytes:
+                # Evicting everything would not be enough, so keep what is there
+                return False
+            for _, path, size in entries:
+                if used + nbytes <= self.quota_bytes:
+                    break
+                if path in in_use:
+                    continue
+                _remove(path)
+                used -= size
+                self.used_bytes, self.entries = used, self.entries - 1
+                self.evictions += 1
+                self.evicted_bytes += size
+                print(f"Evicted {path} ({size / 2**20:.1f} MB) to stay within the storage quota")
+            return used + nbytes <= self.quota_bytes
+
+    def sweep(self):
+        """Remove what jobs cut off by a restart left behind: temporary workspaces and scratch files
+
+        Only those of processes that have exited, as other server workers
+        may share the directories.
+        """
+        removed = 0
+        for root in (self.root, self.scratch_root):
+            if not root or not os.path.isdir(root):
+                continue
+            for entry in os.scandir(root):
+                if entry.name.startswith(TEMPORARY_PREFIX) and _orphaned(entry.name):
+                    _remove(entry.path)
+                    removed += 1
+        return removed
+
+    def status(self) -> dict:
+        with self._lock:
+            return {
+                "root": self.root,
+                "quota_mb": round(self.quota_bytes / 2**20, 1),
+                "used_mb": round(self.used_bytes / 2**20, 1),
+                "entries": self.entries,
+                "pinned": len(self._pinned),
+                "evictions": self.evictions,
+                "evicted_mb": round(self.evicted_bytes / 2**20, 1),
+                "scratch": self.scratch_root or None,
+            }
+
+
+storage = StorageManager(config.STORAGE_DIR, int(config.STORAGE_QUOTA_MB * 2**20), config.SCRATCH_DIR)
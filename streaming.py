@@ -0,0 +1,166 @@
+import asyncio
+import json
+import zlib
+
+import config
+
+
+class WireFormat:
+    """Payloads of a transcription stream, as (event id, payload) messages
+
+    The full format sends one event per segment with readable field names.
+    The compact format sends every segment that arrived within the
+    coalescing window as one event, with one-letter keys and segments as
+    [start, end, text] lists (plus [[start, end, word], ...] with word
+    timestamps). Either way a segment message's id is <job>:<seq> of its
+    last segment, so a reconnecting client resumes after it.
+    """
+
+    def __init__(self, compact: bool = False):
+        self.compact = compact
+        self.window = config.STREAM_COALESCE_MS / 1000 if compact else 0.0
+
+    def job(self, job_id: str) -> list:
+        if self.compact:
+            return [(None, {"t": "j", "id": job_id})]
+        return [(None, {"type": "job", "data": {"id": job_id}})]
+
+    def segments(self, job_id: str, segments: list) -> list:
+        """Messages for (seq, segment) pairs"""
+        if not segments:
+            return []
+        if self.compact:
+            return [(f"{job_id}:{segments[-1][0]}", {"t": "s", "s": [compact_segment(data) for _, data in segments]})]
+        return [(f"{job_id}:{seq}", {"type": "segment", "data": data}) for seq, data in segments]
+
+    def stored(self, job_id: str, segments: list, batch: int = 256) -> list:
+        """Messages replaying stored (seq, segment) pairs, a few hundred per compact event"""
+        messages = []
+        for i in range(0, len(segments), batch):
+            messages += self.segments(job_id, segments[i:i + batch])
+        return messages
+
+    def complete(self) -> list:
+        return [(None, {"t": "c"} if self.compact else {"type": "complete"})]
+
+    def error(self, message: str) -> list:
+        return [(None, {"t": "e", "m": message} if self.compact else {"type": "error", "message": message})]
+
+    def interrupted(self) -> list:
+        """Sent when another connection takes the job over, so clients stop instead of reconnecting"""
+        return [(None, {"t": "i"} if self.compact else {"type": "interrupted"})]
+
+    def dumps(self, payload: dict) -> str:
+        if self.compact:
+            return json.dumps(payload, separators=(",", ":"), ensure_ascii=False)
+        return json.dumps(payload)
+
+
+def compact_segment(data: dict) -> list:
+    segment = [round(data["start"], 2), round(data["end"], 2), data["text"]]
+    if data.get("words"):
+        segment.append([[w["start"], w["end"], w["word"]] for w in data["words"]])
+    return segment
+
+
+async def sse_events(messages, fmt: WireFormat):
+    """EventSourceResponse events for (id, payload) messages"""
+    async for event_id, payload in messages:
+        event = {"event": "message", "data": fmt.dumps(payload)}
+        if event_id:
+            event["id"] = event_id
+        yield event
+
+
+async def ndjson_lines(messages, fmt: WireFormat, gzip: bool = False):
+    """One JSON document per line; with gzip, compressed and flushed after every message"""
+    compressor = zlib.compressobj(wbits=31) if gzip else None
+    async for _, payload in messages:
+        line = (fmt.dumps(payload) + "\n").encode()
+        if compressor is None:
+            yield line
+        else:
+            # A sync flush ends each message on a byte boundary, so it reaches the client now
+            yield compressor.compress(line) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    if compressor is not None:
+        yield compressor.flush()
+
+
+async def run_transcription(events: asyncio.Queue, job_events):
+    """Drive a job's transcription in the background, queueing (kind, event) pairs"""
+    try:
+        async for event in job_events:
+            await events.put(("segment", event))
+        await events.put(("complete", None))
+    except Exception as e:
+        print(f"Error occurred: {str(e)}")
+        await events.put(("error", str(e)))
+
+
+async def _disconnected(request):
+    while True:
+        message = await request.receive()
+        if message["type"] == "http.disconnect":
+            return
+
+
+class JobStream:
+    """A job's transcription running as its own task, feeding the response through a queue
+
+    A bounded queue holds inference back while the client reads slowly
+    (the upload endpoint passes maxsize=0, as its response only starts
+    once the body is in). Inference is cancelled as soon as stop is set,
+    by the client disconnecting or another connection taking the job
+    over, rather than when the next segment is ready.
+    """
+
+    def __init__(self, job_events, stop: asyncio.Event, maxsize: int = None):
+        self.stop = stop
+        self.outcome = None  # "complete", "error" or "interrupted" once the job has ended
+        self.events = asyncio.Queue(config.STREAM_QUEUE_SIZE if maxsize is None else maxsize)
+        self.task = asyncio.create_task(run_transcription(self.events, job_events))
+        self._watchers = [asyncio.create_task(self._watch())]
+
+    async def _watch(self):
+        await self.stop.wait()
+        self.task.cancel()
+        await self.events.put(("interrupted", None))
+
+    def watch_disconnect(self, request):
+        """Stop when the client disconnects; call once the request body has been read"""
+        self._watchers.append(asyncio.create_task(self._disconnect(request)))
+
+    async def _disconnect(self, request):
+        await _disconnected(request)
+        print("Client disconnected")
+        self.stop.set()
+
+    async def batches(self, window: float = 0.0):
+        """Yield ("segments", [events]) groups, then one final ("complete" | "error" | "interrupted", detail)
+
+        Segments arriving within window seconds of the first in a group are
+        sent together; with no window, only segments already queued are.
+        """
+        while True:
+            kind, event = await self.events.get()
+            if kind != "segment":
+                self.outcome = kind
+                yield kind, event
+                return
+            group = [event]
+            if window > 0:
+                await asyncio.sleep(window)
+            while not self.events.empty():
+                kind, event = self.events.get_nowait()
+                if kind != "segment":
+                    self.outcome = kind
+                    yield "segments", group
+                    yield kind, event
+                    return
+                group.append(event)
+            yield "segments", group
+
+    def cancel(self):
+        self.task.cancel()
+        for watcher in self._watchers:
+            watcher.cancel()
@@ -0,0 +1,47 @@
+from types import SimpleNamespace
+
+import torch
+
+import batch_engine
+
+
+def result(no_speech_prob=0.1, avg_logprob=-0.3, compression_ratio=1.5, temperature=0.0):
+    return SimpleNamespace(no_speech_prob=no_speech_prob, avg_logprob=avg_logprob,
+                           compression_ratio=compression_ratio, temperature=temperature)
+
+
+def fake_decode(first):
+    """whisper.decode stand-in: the first call returns first, retries return good results"""
+    calls = []
+
+    def decode(model, features, options):
+        calls.append((options.temperature, len(features)))
+        if len(calls) == 1:
+            return first
+        return [result(temperature=options.temperature) for _ in range(len(features))]
+
+    return decode, calls
+
+
+def test_repetition_loop_with_high_no_speech_prob_is_retried(monkeypatch):
+    loop = result(no_speech_prob=0.9, avg_logprob=-0.5, compression_ratio=3.0)
+    decode, calls = fake_decode([result(), loop])
+    monkeypatch.setattr(batch_engine.whisper, "decode", decode)
+
+    results = batch_engine.decode(None, torch.zeros(2, 1), language="en")
+
+    assert calls == [(0.0, 2), (0.2, 1)]
+    assert results[0].temperature == 0.0
+    assert results[1].temperature == 0.2
+
+
+def test_silence_is_not_retried(monkeypatch):
+    silence = result(no_speech_prob=0.9, avg_logprob=-1.5, compression_ratio=3.0)
+    decode, calls = fake_decode([silence])
+    monkeypatch.setattr(batch_engine.whisper, "decode", decode)
+
+    results = batch_engine.decode(None, torch.zeros(1, 1), language="en")
+
+    assert calls == [(0.0, 1)]
+    assert results == [silence]
+    assert batch_engine._is_silence(silence)
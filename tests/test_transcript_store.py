@@ -0,0 +1,29 @@
+from transcript_store import Transcript, export_srt
+
+
+def mixed_transcript() -> Transcript:
+    transcript = Transcript()
+    transcript.append(0.0, 2.0, " Hello there", [{"start": 0.0, "end": 0.8, "word": " Hello"},
+                                                  {"start": 0.9, "end": 2.0, "word": " there"}])
+    transcript.append(2.0, 5.0, " [Music]")
+    transcript.append(5.0, 6.0, " Bye", [{"start": 5.0, "end": 6.0, "word": " Bye"}])
+    return transcript
+
+
+def test_word_cues_keep_segments_without_words():
+    cues = list(mixed_transcript().cues(words=True))
+
+    assert cues == [(0.0, 0.8, "Hello"), (0.9, 2.0, "there"), (2.0, 5.0, " [Music]"), (5.0, 6.0, "Bye")]
+
+
+def test_segment_cues_ignore_word_timings():
+    cues = list(mixed_transcript().cues())
+
+    assert cues == [(0.0, 2.0, " Hello there"), (2.0, 5.0, " [Music]"), (5.0, 6.0, " Bye")]
+
+
+def test_srt_export_numbers_mixed_cues():
+    srt = "".join(export_srt(mixed_transcript(), words=True))
+
+    assert "3\n00:00:02,000 --> 00:00:05,000\n [Music]\n" in srt
+    assert srt.count(" --> ") == 4
@@ -0,0 +1,113 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import config
+
+
+def file_digest(path: str) -> str:
+    """SHA-256 of a file's bytes, read in 1 MB blocks"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return f"sha256:{digest.hexdigest()}"
+
+
+def video_id(url: str) -> str:
+    """Stable id for a video URL, without downloading it"""
+    import yt_dlp
+    try:
+        with yt_dlp.YoutubeDL({"quiet": True, "nocheckcertificate": True}) as ydl:
+            info = ydl.extract_info(url, download=False, process=False)
+        return f"{info.get('extractor_key') or info.get('ie_key')}:{info['id']}"
+    except Exception as e:
+        print(f"Could not resolve video id, keying cache by URL: {str(e)}")
+        return f"url:{url}"
+
+
+def cache_key(source: str, model: str, options: dict) -> str:
+    payload = json.dumps({"source": source, "model": model, "options": options}, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class TranscriptCache:
+    """Persistent segment lists keyed by audio, model and decode options"""
+
+    def __init__(self, path: str, max_bytes: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._db = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._db is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS transcripts ("
+                "key TEXT PRIMARY KEY, segments TEXT NOT NULL, size INTEGER NOT NULL, "
+                "created REAL NOT NULL, last_used REAL NOT NULL)"
+            )
+            self._db.commit()
+        return self._db
+
+    def get(self, key: str):
+        """Cached segments for key, or None"""
+        with self._lock:
+            db = self._connect()
+            row = db.execute("SELECT segments FROM transcripts WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            db.execute("UPDATE transcripts SET last_used = ? WHERE key = ?", (time.time(), key))
+            db.commit()
+            self.hits += 1
+            return json.loads(row[0])
+
+    def put(self, key: str, segments: list):
+        data = json.dumps(segments)
+        now = time.time()
+        with self._lock:
+            db = self._connect()
+            db.execute(
+                "INSERT OR REPLACE INTO transcripts (key, segments, size, created, last_used) VALUES (?, ?, ?, ?, ?)",
+                (key, data, len(data), now, now),
+            )
+            self._evict(db)
+            db.commit()
+
+    def _evict(self, db: sqlite3.Connection):
+        total = db.execute("SELECT COALESCE(SUM(size), 0) FROM transcripts").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in db.execute("SELECT key, size FROM transcripts ORDER BY last_used").fetchall():
+            db.execute("DELETE FROM transcripts WHERE key = ?", (key,))
+            self.evictions += 1
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    def status(self) -> dict:
+        with self._lock:
+            entries, size = self._connect().execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM transcripts"
+            ).fetchone()
+        return {
+            "enabled": config.TRANSCRIPT_CACHE,
+            "entries": entries,
+            "size_mb": round(size / 2**20, 2),
+            "max_mb": round(self.max_bytes / 2**20, 2),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+transcript_cache = TranscriptCache(config.TRANSCRIPT_CACHE_PATH, int(config.TRANSCRIPT_CACHE_MAX_MB * 2**20))
@@ -0,0 +1,186 @@
+import json
+import threading
+import time
+from array import array
+from collections import OrderedDict
+
+import config
+from job_store import job_store
+
+
+class Transcript:
+    """One job's segments held as columns
+
+    Start and end times are float arrays and texts a list, one entry per
+    segment. Word timings, when present, are flattened into columns of
+    their own; the words of segment i are word_index[i]:word_index[i + 1].
+    """
+
+    def __init__(self):
+        self.starts = array("d")
+        self.ends = array("d")
+        self.texts = []
+        self.word_index = array("l", [0])
+        self.word_starts = array("d")
+        self.word_ends = array("d")
+        self.words = []
+
+    def append(self, start: float, end: float, text: str, words: list = None):
+        self.starts.append(start)
+        self.ends.append(end)
+        self.texts.append(text)
+        for word in words or ():
+            self.word_starts.append(word["start"])
+            self.word_ends.append(word["end"])
+            self.words.append(word["word"])
+        self.word_index.append(len(self.words))
+
+    def __len__(self) -> int:
+        return len(self.texts)
+
+    @property
+    def has_words(self) -> bool:
+        return bool(self.words)
+
+    @property
+    def duration(self) -> float:
+        return max(self.ends, default=0.0)
+
+    def segment_words(self, i: int) -> list:
+        return [{"start": self.word_starts[w], "end": self.word_ends[w], "word": self.words[w]}
+                for w in range(self.word_index[i], self.word_index[i + 1])]
+
+    def segment(self, i: int) -> dict:
+        segment = {"start": self.starts[i], "end": self.ends[i], "text": self.texts[i]}
+        if self.word_index[i + 1] > self.word_index[i]:
+            segment["words"] = self.segment_words(i)
+        return segment
+
+    def cues(self, words: bool = False):
+        """(start, end, text) per segment, or per word when words is set
+
+        Segments without word timings, such as music or ones checkpointed
+        before words were recorded, stay whole cues either way.
+        """
+        if not (words and self.has_words):
+            return zip(self.starts, self.ends, self.texts)
+        return self._word_cues()
+
+    def _word_cues(self):
+        for i in range(len(self)):
+            first, last = self.word_index[i], self.word_index[i + 1]
+            if first == last:
+                yield self.starts[i], self.ends[i], self.texts[i]
+            for w in range(first, last):
+                yield self.word_starts[w], self.word_ends[w], self.words[w].strip()
+
+    def nbytes(self) -> int:
+        columns = (self.starts, self.ends, self.word_index, self.word_starts, self.word_ends)
+        text = sum(len(t) for t in self.texts) + sum(len(w) for w in self.words)
+        return sum(c.itemsize * len(c) for c in columns) + text
+
+
+def clock(seconds: float, separator: str = ",") -> str:
+    """HH:MM:SS,mmm as used by SRT (VTT uses a dot)"""
+    millis = int(round(seconds * 1000))
+    hours, millis = divmod(millis, 3600000)
+    minutes, millis = divmod(millis, 60000)
+    seconds, millis = divmod(millis, 1000)
+    return f"{hours:02d}:{minutes:02d}:{seconds:02d}{separator}{millis:03d}"
+
+
+def export_srt(transcript: Transcript, words: bool = False):
+    for n, (start, end, text) in enumerate(transcript.cues(words), 1):
+        yield f"{n}\n{clock(start)} --> {clock(end)}\n{text}\n\n"
+
+
+def export_vtt(transcript: Transcript, words: bool = False):
+    yield "WEBVTT\n\n"
+    for start, end, text in transcript.cues(words):
+        yield f"{clock(start, '.')} --> {clock(end, '.')}\n{text}\n\n"
+
+
+def export_txt(transcript: Transcript, words: bool = False):
+    # Same layout as the page used to build: [HH:MM:SS] text
+    for start, _, text in transcript.cues(words):
+        yield f"[{clock(start)[:8]}] {text}\n"
+
+
+def export_json(transcript: Transcript, words: bool = False):
+    yield "{\"segments\": ["
+    for i in range(len(transcript)):
+        yield (", " if i else "") + json.dumps(transcript.segment(i))
+    metadata = {"totalSegments": len(transcript), "duration": transcript.duration,
+                "generatedAt": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())}
+    yield "], \"metadata\": " + json.dumps(metadata) + "}\n"
+
+
+# Export format -> (writer, media type)
+EXPORTS = {
+    "srt": (export_srt, "application/x-subrip"),
+    "vtt": (export_vtt, "text/vtt"),
+    "txt": (export_txt, "text/plain"),
+    "json": (export_json, "application/json"),
+}
+
+
+def stream_export(transcript: Transcript, fmt: str, words: bool = False, batch: int = 256):
+    """Export text in pieces of a few hundred cues, so large transcripts stream without being joined whole"""
+    writer, _ = EXPORTS[fmt]
+    pieces = []
+    for piece in writer(transcript, words):
+        pieces.append(piece)
+        if len(pieces) >= batch:
+            yield "".join(pieces)
+            pieces = []
+    if pieces:
+        yield "".join(pieces)
+
+
+class TranscriptStore:
+    """Columnar transcripts of finished jobs, built from the job store and kept least-recently-used
+
+    Jobs still running are read fresh on every request, so an export
+    covers whatever has been checkpointed so far.
+    """
+
+    def __init__(self, jobs, capacity: int):
+        self.jobs = jobs
+        self.capacity = capacity
+        self._transcripts = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, job_id: str):
+        """The job's Transcript, or None for an unknown job"""
+        with self._lock:
+            transcript = self._transcripts.get(job_id)
+            if transcript is not None:
+                self._transcripts.move_to_end(job_id)
+                return transcript
+
+        job = self.jobs.get(job_id)
+        if job is None:
+            return None
+        transcript = Transcript()
+        for _, segment in self.jobs.segments(job_id):
+            transcript.append(segment["start"], segment["end"], segment["text"], segment.get("words"))
+
+        if job["status"] == "complete" and self.capacity > 0:
+            with self._lock:
+                self._transcripts[job_id] = transcript
+                while len(self._transcripts) > self.capacity:
+                    self._transcripts.popitem(last=False)
+        return transcript
+
+    def status(self) -> dict:
+        with self._lock:
+            transcripts = list(self._transcripts.values())
+        return {
+            "transcripts": len(transcripts),
+            "capacity": self.capacity,
+            "segments": sum(len(t) for t in transcripts),
+            "bytes": sum(t.nbytes() for t in transcripts),
+        }
+
+
+transcript_store = TranscriptStore(job_store, config.TRANSCRIPT_STORE_SIZE)
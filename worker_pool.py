@@ -0,0 +1,185 @@
+import asyncio
+import contextvars
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+import config
+import metrics
+from model_registry import registry
+
+
+class PoolBusyError(RuntimeError):
+    """Raised when a pool has no room for another job"""
+
+
+class Cancelled(Exception):
+    """Raised inside a pool task that stopped early because nobody awaits it any more"""
+
+
+# Set in a thread pool task once the coroutine awaiting it is cancelled;
+# long-running work checks it to stop early (see batch_engine)
+cancel_flag = contextvars.ContextVar("cancel_flag", default=None)
+
+
+def transcribe_chunk(model_name: str, chunk, backend: str = None, **options) -> dict:
+    """Run one Whisper transcription inside a pool worker"""
+    with registry.use(model_name, backend) as model:
+        return model.transcribe(chunk, **options)
+
+
+_inference_imported = False
+
+
+def _import_inference():
+    global _inference_imported
+    import backends  # noqa: F401
+    import batch_engine  # noqa: F401
+    _inference_imported = True
+
+
+async def import_inference():
+    """Import torch, whisper and the inference modules in an IO thread
+
+    Their first import takes seconds, and on the event loop it would hold
+    up every connection. Concurrent callers wait on the import lock in
+    their own threads; once it is done this returns at once.
+    """
+    if not _inference_imported:
+        await io_pool.run(_import_inference)
+
+
+def set_torch_threads(threads: int):
+    """Pool initializer: importing torch is deferred to the first inference worker"""
+    import torch
+    torch.set_num_threads(threads)
+
+
+def _timed_call(fn, args, kwargs):
+    # Wall-clock start time so waits can be measured across processes too
+    started = time.time()
+    return started, metrics.profile_call(fn, args, kwargs)
+
+
+class Admission:
+    """A job's slot in a pool, released exactly once"""
+
+    def __init__(self, pool):
+        self._pool = pool
+        self._released = False
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self._pool._release()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class WorkerPool:
+    """Bounded thread or process pool that keeps blocking work off the event loop"""
+
+    def __init__(self, name: str, kind: str, workers: int, max_queued_jobs: int, initializer=None,
+                 initargs: tuple = ()):
+        self.name = name
+        self.kind = kind
+        self.workers = max(1, workers)
+        self.max_jobs = self.workers + max(0, max_queued_jobs)
+        if kind == "process":
+            self._executor = ProcessPoolExecutor(self.workers, initializer=initializer, initargs=initargs)
+        else:
+            self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix=name, initializer=initializer,
+                                                initargs=initargs)
+        self._lock = threading.Lock()
+        self.active_jobs = 0
+        self.pending_tasks = 0
+        self.completed_tasks = 0
+        self.failed_tasks = 0
+        self.cancelled_tasks = 0
+        self.rejected_jobs = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    def admit(self) -> Admission:
+        """Reserve a job slot or raise PoolBusyError when the queue is full"""
+        with self._lock:
+            if self.active_jobs >= self.max_jobs:
+                self.rejected_jobs += 1
+                raise PoolBusyError("Server is busy, please try again shortly")
+            self.active_jobs += 1
+        return Admission(self)
+
+    def _release(self):
+        with self._lock:
+            self.active_jobs -= 1
+
+    def saturated(self) -> bool:
+        return self.active_jobs >= self.max_jobs
+
+    async def run(self, fn, *args, **kwargs):
+        """Run fn(*args, **kwargs) in the pool and await its result
+
+        Cancelling the caller drops the task if it has not started; a task
+        already running in a thread sees its cancel_flag set.
+        """
+        submitted = time.time()
+        cancelled = threading.Event()
+        with self._lock:
+            self.pending_tasks += 1
+        if self.kind == "process":
+            future = self._executor.submit(_timed_call, fn, args, kwargs)
+        else:
+            # Carry the current job id into the worker thread for spans and profiles
+            context = contextvars.copy_context()
+            context.run(cancel_flag.set, cancelled)
+            future = self._executor.submit(context.run, _timed_call, fn, args, kwargs)
+        future.add_done_callback(lambda f: self._task_done(f, submitted))
+        try:
+            started, result = await asyncio.wrap_future(future)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+        return result
+
+    def _task_done(self, future, submitted: float):
+        with self._lock:
+            self.pending_tasks -= 1
+            if future.cancelled() or isinstance(future.exception(), Cancelled):
+                self.cancelled_tasks += 1
+                return
+            if future.exception() is not None:
+                self.failed_tasks += 1
+                return
+            wait = max(0.0, future.result()[0] - submitted)
+            self.completed_tasks += 1
+            self._wait_total += wait
+            self._wait_max = max(self._wait_max, wait)
+
+    def status(self) -> dict:
+        with self._lock:
+            done = self.completed_tasks
+            return {
+                "kind": self.kind,
+                "workers": self.workers,
+                "max_jobs": self.max_jobs,
+                "active_jobs": self.active_jobs,
+                "queue_depth": max(0, self.pending_tasks - self.workers),
+                "completed_tasks": done,
+                "failed_tasks": self.failed_tasks,
+                "cancelled_tasks": self.cancelled_tasks,
+                "rejected_jobs": self.rejected_jobs,
+                "avg_wait_seconds": round(self._wait_total / done, 4) if done else 0.0,
+                "max_wait_seconds": round(self._wait_max, 4),
+            }
+
+
+inference_pool = WorkerPool("inference", config.WORKER_POOL_KIND, config.INFERENCE_WORKERS, config.MAX_QUEUED_JOBS,
+                            set_torch_threads, (config.TORCH_THREADS,))
+io_pool = WorkerPool("io", "thread", config.IO_WORKERS, config.MAX_QUEUED_JOBS)
+# Blocking reads of jobs' PCM pipes, which wait as long as a slow upload or download does, get threads of
+# their own so they never hold up io_pool's checkpoints, cache writes and downloads; one per admitted job
+reader_pool = WorkerPool("reader", "thread", inference_pool.max_jobs, 0)